@@ -1,7 +1,13 @@
 import os
-import dashscope
+import re
+import time
 import math
-from PIL import Image
+import random
+import asyncio
+import logging
+import threading
+from queue import Queue, Empty
+from concurrent.futures import ThreadPoolExecutor
 
 
 MODEL = 'qwen-vl-max-latest'
@@ -16,6 +22,22 @@ PROMPT_PAGE_JUDGE = """
 5白页:图中必须无任何内容/结构，表现单一色彩,。 
 仅回复类型序号
 """
+PROMPT_PAGE_JUDGE_BATCH = PROMPT_PAGE_JUDGE.replace("仅回复类型序号", """共{count}张图片,按输入顺序编号1至{count},分别判断类型;
+每行回复一张图片,格式为 编号:类型序号,如 1:3,不要输出其他内容""")
+
+# AI 判定阶段: 并发调用数 / 每秒调用数 / 突发容量 / 限流重试次数 / 待判定队列长度
+AI_CONCURRENCY = 4
+AI_RATE = 2.0
+AI_BURST = 4
+AI_RETRIES = 3
+AI_BACKOFF = 2.0
+AI_QUEUE_SIZE = 32
+# 批量判定: 单次请求的 token 预算 / 提示词占用估算 / 单图最少 token
+AI_BATCH_SIZE = 1
+AI_BATCH_WAIT = 0.5
+AI_TOKEN_BUDGET = 4000
+AI_PROMPT_TOKENS = 300
+AI_MIN_IMAGE_TOKENS = 64
 
 
 """
@@ -23,6 +45,7 @@ PROMPT_PAGE_JUDGE = """
 @param imgPath
 """ 
 def agent_call(token,**msg):
+    import dashscope
     msg_keys = msg.keys()
     if 'imgPath'  not in msg_keys or 'text' not in msg_keys:
         return 
@@ -44,6 +67,47 @@ def agent_call(token,**msg):
         messages=messages
         )
 
+def agent_call_batch(token, imgPaths: list, text: str):
+    """
+    多张截图合并为一次请求
+    """
+    import dashscope
+    imgPaths = [p for p in imgPaths if p and os.path.exists(p)]
+    if not imgPaths:
+        return
+    content = [{'image': f"file://{p}"} for p in imgPaths]
+    content.append({"text": text})
+    return dashscope.MultiModalConversation.call(
+        api_key=token,
+        model=MODEL,
+        messages=[{"role": "user", "content": content}]
+        )
+
+
+# 编号与类型须在同一行,避免把下一行的编号当作上一张截图的类型
+BATCH_ANSWER_RE = re.compile(r"(\d+)[ \t]*[:：.、\-)）][ \t]*([1-5])")
+
+
+def parse_batch_answer(text, count: int) -> dict:
+    """
+    解析批量判定回复,返回 {编号(1起): 类型序号},缺失或越界的编号不出现在结果中
+    """
+    if not isinstance(text, str):
+        return {}
+    answers = {}
+    for line in text.splitlines():
+        for no, kind in BATCH_ANSWER_RE.findall(line):
+            no = int(no)
+            if 1 <= no <= count and no not in answers:
+                answers[no] = kind
+    if not answers:
+        # 模型只按顺序回复了序号列表
+        kinds = re.findall(r"[1-5]", text)
+        if len(kinds) == count:
+            answers = {i + 1: kind for i, kind in enumerate(kinds)}
+    return answers
+
+
 # dashscope.MultiModalConversation.call(
 #         api_key=token,
 #         model=MODEL, # 此处以qwen-vl-max为例,可按需更换模型名称。模型列表:https://help.aliyun.com/zh/model-studio/getting-started/models
@@ -84,6 +148,18 @@ def agent_call_stream(response):
     return answer_content
 
 
+class AIThrottled(Exception):
+    pass
+
+
+def is_throttled(response) -> bool:
+    try:
+        code = response.get("code") or ""
+        return response.get("status_code") == 429 or code.startswith("Throttling")
+    except AttributeError:
+        return False
+
+
 def getAIResponse(response:dict) -> str:
     try:
         return response["output"]["choices"][0]["message"].content[0]["text"]
@@ -92,6 +168,7 @@ def getAIResponse(response:dict) -> str:
 
 
 def is_token_valid(token: str) -> bool:
+    import dashscope
     messages = [
         {
             "role": "user",
@@ -122,6 +199,7 @@ def imgTokenSimplizer(imgPath,compression_ratio = 0):
     :param compression_ratio: 压缩强度,1.0=最小 token,0.5=更清晰,0=不压缩
     :return: 新文件的绝对路径
     """
+    from PIL import Image
     image = Image.open(imgPath)
     width, height = image.size
     aspect_ratio = width / height
@@ -163,7 +241,35 @@ def imgTokenSimplizer(imgPath,compression_ratio = 0):
     return new_file_path
 
 
+def imgTokenFit(imgPath, max_tokens: int):
+    """
+    按 token 预算压缩图像: 用 token_calculate 评估,超出预算时等比缩小直至满足
+    :return: 新文件的绝对路径
+    """
+    from PIL import Image
+    image = Image.open(imgPath)
+    width, height = image.size
+    if token_calculate(imgPath) <= max_tokens:
+        # 已按 28 对齐(图片流水线产出)的图片无需重新编码
+        if width % 28 == 0 and height % 28 == 0:
+            return os.path.abspath(imgPath)
+        return imgTokenSimplizer(imgPath)
+    # 每 28x28 像素块约 1 个 token,另有 2 个起止 token
+    scale = math.sqrt(max(max_tokens - 2, 4) * 28 * 28 / (width * height))
+    dir_name, file_name = os.path.split(imgPath)
+    name, ext = os.path.splitext(file_name)
+    new_file_path = os.path.abspath(os.path.join(dir_name, f"{name}_retoken{ext}"))
+    while True:
+        new_width = max(56, int(width * scale // 28 * 28))
+        new_height = max(56, int(height * scale // 28 * 28))
+        image.resize((new_width, new_height), Image.LANCZOS).save(new_file_path)
+        if token_calculate(new_file_path) <= max_tokens or (new_width == 56 and new_height == 56):
+            return new_file_path
+        scale *= 0.9
+
+
 def token_calculate(imgPath):
+    from PIL import Image
     image = Image.open(imgPath)
     height, width = image.height, image.width
     h_bar = round(height / 28) * 28
@@ -182,6 +288,150 @@ def token_calculate(imgPath):
     total_token = token + 2 
     return total_token
 
+# === 异步 AI 判定阶段 ===
+class TokenBucket:
+    """
+    令牌桶限速,仅在事件循环线程内使用
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AIDispatcher:
+    """
+    浏览器线程把截图交给有界队列后立即处理下一个目标,
+    后台事件循环以限定并发 + 令牌桶速率调用模型,限流/异常时指数退避重试;
+    batch_size > 1 时在 AI_BATCH_WAIT 窗口内攒批,多张截图合并为一次请求
+    """
+
+    def __init__(self, classify, on_done, concurrency=AI_CONCURRENCY, rate=AI_RATE, burst=AI_BURST,
+                 retries=AI_RETRIES, queue_size=AI_QUEUE_SIZE, batch_size=AI_BATCH_SIZE):
+        """
+        :param classify: classify(jobs) -> 与 jobs 等长的判定结果列表(元素可为 None),被限流时抛出 AIThrottled
+        :param on_done: on_done(job, verdict),verdict 为 None 表示 AI 判定失败
+        """
+        self.classify = classify
+        self.batch_size = max(1, batch_size)
+        self.on_done = on_done
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self._queue = Queue(maxsize=queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency * 2 + 1, thread_name_prefix="ai-call")
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._consume()), name="ai-dispatcher", daemon=True)
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.throttled = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def submit(self, job):
+        self._queue.put(job)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _next_batch(self):
+        """
+        阻塞取第一个任务,再在攒批窗口内尽量凑满 batch_size
+        :return: (jobs, 是否已收到结束标记)
+        """
+        job = self._queue.get()
+        if job is None:
+            return [], True
+        jobs = [job]
+        deadline = time.time() + AI_BATCH_WAIT
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+        return jobs, False
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.rate, self.burst)
+        tasks = set()
+        ended = False
+        while not ended:
+            jobs, ended = await loop.run_in_executor(self._executor, self._next_batch)
+            if not jobs:
+                continue
+            await semaphore.acquire()
+            task = asyncio.create_task(self._handle(loop, jobs, semaphore, bucket))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _handle(self, loop, jobs, semaphore, bucket):
+        verdicts = [None] * len(jobs)
+        try:
+            for attempt in range(self.retries + 1):
+                await bucket.acquire()
+                start = time.time()
+                try:
+                    verdicts = await loop.run_in_executor(self._executor, self.classify, jobs)
+                    break
+                except AIThrottled:
+                    with self._lock:
+                        self.throttled += 1
+                    logging.info(f"AI 调用被限流,第 {attempt + 1} 次重试")
+                except Exception as e:
+                    logging.exception(f"AI 调用异常: {e}")
+                finally:
+                    with self._lock:
+                        self.latencies.append(time.time() - start)
+                if attempt < self.retries:
+                    await asyncio.sleep(AI_BACKOFF * 2 ** attempt + random.uniform(0, 1))
+            with self._lock:
+                self.failed += sum(1 for verdict in verdicts if verdict is None)
+        finally:
+            semaphore.release()
+        for job, verdict in zip(jobs, verdicts):
+            try:
+                await loop.run_in_executor(self._executor, self.on_done, job, verdict)
+            except Exception as e:
+                logging.exception(f"AI 判定回调异常: {e}")
+
+    def stats(self) -> str:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return "无调用"
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return (f"调用 {len(latencies)} 次, 平均 {sum(latencies) / len(latencies):.2f}s, "
+                f"p50 {p50:.2f}s, p95 {p95:.2f}s, 限流 {self.throttled} 次, 失败 {self.failed} 次")
+
+
 if __name__ == "__main__":
   
     pass
\ No newline at end of file
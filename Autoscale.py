@@ -0,0 +1,191 @@
+import os
+import time
+import logging
+import threading
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# === 配置 ===
+AUTOSCALE_MIN_WORKERS = 2
+AUTOSCALE_INTERVAL = 10
+# 单个浏览器工作线程的内存估算(MB),可测量时以实测为准
+WORKER_MEM_ESTIMATE_MB = 500
+# 系统至少保留的可用内存(MB)
+MEM_RESERVE_MB = 1024
+CPU_HIGH = 90
+CPU_GROW = 75
+TIMEOUT_RATE_HIGH = 0.3
+
+
+def _cpu_percent() -> float:
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None)
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1) * 100
+    except (AttributeError, OSError):
+        return 0
+
+
+def _mem_available_mb():
+    if psutil is None:
+        return None
+    return psutil.virtual_memory().available / 1024 / 1024
+
+
+def tree_rss_mb(pid=None):
+    """
+    进程及全部子进程(geckodriver/Firefox)的内存占用
+    :param pid: 为空则统计当前进程
+    :return: MB,未安装 psutil 或进程已退出时返回 None
+    """
+    if psutil is None:
+        return None
+    try:
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        total = 0
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 1024 / 1024
+    except psutil.Error:
+        return None
+
+
+class Autoscaler:
+    """
+    按实测吞吐(完成数/秒)、CPU/内存余量与超时率动态增减浏览器工作线程。
+    爬山策略: 加线程后吞吐未提升则暂停扩容,出现资源压力或超时率过高时缩容。
+    """
+
+    def __init__(self, spawn, pending, min_workers=AUTOSCALE_MIN_WORKERS, max_workers=8,
+                 mem_budget_mb=None, interval=AUTOSCALE_INTERVAL):
+        """
+        :param spawn: spawn(stop_event) -> 已启动的 Thread
+        :param pending: 返回剩余任务数的函数
+        :param mem_budget_mb: 本工具(含浏览器)可用的内存上限,None 为不限制
+        """
+        self._spawn = spawn
+        self._pending = pending
+        self.min_workers = max(1, min(min_workers, max_workers))
+        self.max_workers = max_workers
+        self.mem_budget_mb = mem_budget_mb
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._workers = []
+        self._stopped = False
+        self._completed = 0
+        self._timeouts = 0
+        self._controller = None
+        self.peak_workers = 0
+
+    def record(self, status: str):
+        with self._lock:
+            self._completed += 1
+            if status and "超时" in status:
+                self._timeouts += 1
+
+    def _alive(self):
+        with self._lock:
+            self._workers = [(t, ev) for t, ev in self._workers if t.is_alive()]
+            return [(t, ev) for t, ev in self._workers if not ev.is_set()]
+
+    def _grow(self):
+        with self._lock:
+            if self._stopped:
+                return
+            stop_event = threading.Event()
+            self._workers.append((self._spawn(stop_event), stop_event))
+            self.peak_workers = max(self.peak_workers, len(self._alive()))
+
+    def _shrink(self):
+        active = self._alive()
+        if active:
+            # 线程处理完当前任务后退出
+            active[-1][1].set()
+
+    def start(self):
+        for _ in range(min(self.min_workers, max(1, self._pending()))):
+            self._grow()
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)
+        self._controller = threading.Thread(target=self._run, name="autoscaler", daemon=True)
+        self._controller.start()
+
+    def _run(self):
+        last_time = time.time()
+        last_completed = 0
+        last_timeouts = 0
+        last_rate = 0
+        grew_last = False
+        hold_until = 0
+        while True:
+            time.sleep(self.interval)
+            if not self._alive():
+                break
+
+            now = time.time()
+            with self._lock:
+                completed, timeouts = self._completed, self._timeouts
+            done = completed - last_completed
+            rate = done / (now - last_time)
+            timeout_rate = (timeouts - last_timeouts) / done if done else 0
+            last_time, last_completed, last_timeouts = now, completed, timeouts
+
+            workers = len(self._alive())
+            cpu = _cpu_percent()
+            mem_available = _mem_available_mb()
+            rss = tree_rss_mb()
+            per_worker = rss / workers if rss and workers else WORKER_MEM_ESTIMATE_MB
+            per_worker = max(per_worker, WORKER_MEM_ESTIMATE_MB / 2)
+
+            pressure = []
+            if cpu >= CPU_HIGH:
+                pressure.append(f"CPU {cpu:.0f}%")
+            if mem_available is not None and mem_available < MEM_RESERVE_MB:
+                pressure.append(f"可用内存 {mem_available:.0f}MB")
+            if self.mem_budget_mb and rss and rss > self.mem_budget_mb:
+                pressure.append(f"内存占用 {rss:.0f}MB 超出预算")
+            if timeout_rate >= TIMEOUT_RATE_HIGH and done >= workers:
+                pressure.append(f"超时率 {timeout_rate:.0%}")
+
+            logging.info(f"自动扩缩容: 线程 {workers}, 吞吐 {rate:.2f}/s, CPU {cpu:.0f}%, "
+                         f"可用内存 {mem_available}MB, 占用 {rss}MB, 超时率 {timeout_rate:.0%}")
+
+            if pressure:
+                if workers > self.min_workers:
+                    logging.info(f"自动扩缩容: 缩容({', '.join(pressure)})")
+                    self._shrink()
+                hold_until = now + self.interval * 3
+                grew_last = False
+            elif grew_last and rate <= last_rate * 1.05:
+                # 上次扩容没有带来吞吐提升,暂停扩容
+                hold_until = now + self.interval * 3
+                grew_last = False
+            elif now >= hold_until and workers < self.max_workers and self._pending() > workers \
+                    and cpu < CPU_GROW \
+                    and (mem_available is None or mem_available - per_worker >= MEM_RESERVE_MB) \
+                    and (not self.mem_budget_mb or rss is None or rss + per_worker <= self.mem_budget_mb):
+                logging.info(f"自动扩缩容: 扩容至 {workers + 1}")
+                self._grow()
+                grew_last = True
+            else:
+                grew_last = False
+            last_rate = rate
+
+    def join(self):
+        while True:
+            with self._lock:
+                threads = [t for t, _ in self._workers]
+            for t in threads:
+                t.join()
+            with self._lock:
+                if all(not t.is_alive() for t, _ in self._workers):
+                    self._stopped = True
+                    break
+        if self._controller:
+            self._controller.join(timeout=self.interval + 1)
@@ -0,0 +1,470 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, urljoin
+from selenium.common.exceptions import WebDriverException, JavascriptException
+from ResourcePolicy import FIREFOX_PREFS
+from Autoscale import tree_rss_mb
+
+# === 配置 ===
+PAGE_LOAD_TIMEOUT = 15
+# selenium-wire 自身的请求存储只做兜底,状态码查询走 NavigationCapture
+REQUEST_STORAGE_MAX_SIZE = 100
+# 浏览器回收阈值: 处理页面数 / 进程树内存(MB,需安装 psutil)
+BROWSER_MAX_PAGES = 200
+BROWSER_MAX_RSS_MB = 1500
+# 页面稳定判定: 最长等待 / DOM 静默时长 / 轮询间隔(秒)
+SETTLE_MAX_WAIT = 5
+SETTLE_QUIET = 0.5
+SETTLE_POLL = 0.1
+# 超过该时长仍无响应的请求不再计入在途(被中止或长连接)
+INFLIGHT_STALE = 3
+# 并行启动浏览器的线程数
+BROWSER_LAUNCH_WORKERS = 8
+# Firefox 配置模板缓存目录,按偏好设置哈希区分
+PROFILE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "batchURL-profile")
+PROFILE_INIT_TIMEOUT = 60
+
+# 跳过首次启动的检查、遥测与更新,缩短冷启动
+STARTUP_PREFS = {
+    "browser.shell.checkDefaultBrowser": False,
+    "browser.startup.homepage_override.mstone": "ignore",
+    "browser.aboutwelcome.enabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "toolkit.telemetry.enabled": False,
+    "toolkit.telemetry.reportingpolicy.firstRun": False,
+    "app.update.auto": False,
+    "app.update.enabled": False,
+    "extensions.update.enabled": False,
+    "app.normandy.enabled": False,
+    "browser.discovery.enabled": False,
+    "browser.newtabpage.enabled": False,
+}
+
+
+def normalize_url(url: str):
+    parts = urlsplit(url)
+    # 丢弃 fragment
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ''))
+
+
+def browser_url(url: str) -> str:
+    """
+    浏览器实际请求的地址形式: 协议/主机小写,去掉默认端口与用户名密码,空路径补 /,丢弃 fragment
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        return normalize_url(url)
+    netloc = host if port is None or port == {"http": 80, "https": 443}.get(scheme) else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ''))
+
+
+def browser_prefs(policy=None) -> dict:
+    prefs = dict(STARTUP_PREFS)
+    if policy is not None:
+        prefs.update(FIREFOX_PREFS)
+    return prefs
+
+
+def _user_js(prefs: dict) -> str:
+    return "".join(f'user_pref("{name}", {json.dumps(value)});\n' for name, value in prefs.items())
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_template(prefs: dict) -> str:
+    """
+    构建并缓存 Firefox 配置模板: 写入 user.js 后以 --screenshot 模式启动一次完成初始化,
+    之后各浏览器实例复制模板启动,跳过新建配置的耗时;偏好设置不变时跨批次复用
+    :return: 模板目录
+    """
+    key = hashlib.sha1(json.dumps(prefs, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    path = os.path.join(PROFILE_CACHE_DIR, key)
+    with _profile_lock:
+        if os.path.exists(os.path.join(path, ".ready")):
+            return path
+        building = f"{path}.{os.getpid()}"
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        with open(os.path.join(building, "user.js"), "w", encoding="utf-8") as f:
+            f.write(_user_js(prefs))
+        firefox = os.environ.get("firefox_exe") or shutil.which("firefox")
+        if firefox:
+            try:
+                subprocess.run([firefox, "--headless", "--screenshot", os.path.join(building, "init.png"),
+                                "-profile", building, "about:blank"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PROFILE_INIT_TIMEOUT)
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.info(f"初始化 Firefox 配置模板失败,仅使用 user.js: {e}")
+            for name in ("init.png", "lock", ".parentlock", "parent.lock"):
+                try:
+                    os.remove(os.path.join(building, name))
+                except OSError:
+                    pass
+        open(os.path.join(building, ".ready"), "w").close()
+        try:
+            os.replace(building, path)
+        except OSError:
+            # 其他进程已建好同一模板
+            shutil.rmtree(building, ignore_errors=True)
+        return path
+
+
+# === 创建浏览器实例 ===
+def create_browser(policy=None, profile=None):
+    """
+    :param policy: ResourcePolicy,启用时同时关闭 Service Worker/缓存等
+    :param profile: Firefox 配置模板目录,复制一份供本实例独占使用
+    """
+    # selenium-wire 依赖较重,首次创建浏览器时才导入
+    from seleniumwire import webdriver
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    from selenium.webdriver.firefox.service import Service
+    options = FirefoxOptions()
+    options.add_argument("--headless")
+    options.accept_insecure_certs = True
+    for name, value in browser_prefs(policy).items():
+        options.set_preference(name, value)
+    profile_dir = None
+    if profile:
+        profile_dir = tempfile.mkdtemp(prefix="batchURL-ff-")
+        shutil.copytree(profile, profile_dir, dirs_exist_ok=True)
+        options.add_argument("-profile")
+        options.add_argument(profile_dir)
+    service = Service(os.environ.get('geckodriver_exe'))
+    seleniumwire_options = {
+        'request_storage': 'memory',
+        'request_storage_max_size': REQUEST_STORAGE_MAX_SIZE,
+    }
+    try:
+        driver = webdriver.Firefox(seleniumwire_options=seleniumwire_options, options=options, service=service)
+    except Exception:
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.profile_dir = profile_dir
+    return driver
+
+
+# === 主文档请求链捕获 ===
+class NavigationCapture:
+    """
+    按导航记录主文档请求链: 每一跳重定向的状态码、最终响应状态、Content-Type 与耗时。
+    子资源只做判断不做保存,每个任务开始前 reset,查询为 O(1)。
+    挂载资源策略时一并执行拦截,并按页面统计被拦截的请求数与字节数。
+    """
+
+    def __init__(self, policy=None):
+        self._lock = threading.Lock()
+        self.policy = policy
+        self.reset()
+
+    @classmethod
+    def attach(cls, driver, policy=None):
+        capture = cls(policy)
+        driver.request_interceptor = capture.request_interceptor
+        driver.response_interceptor = capture.response_interceptor
+        return capture
+
+    def reset(self, url: str = None):
+        with self._lock:
+            self._expected = {browser_url(url)} if url else set()
+            self._hops = []
+            self._by_url = {}
+            self._inflight = {}
+            self._blocked = 0
+            self._blocked_bytes = 0
+            self._started = time.time()
+
+    def request_interceptor(self, request):
+        if self.policy is not None and not self._is_expected(request):
+            if self.policy.intercept_request(request):
+                with self._lock:
+                    self._blocked += 1
+                return
+        with self._lock:
+            self._inflight[request.id] = time.time()
+
+    def _is_expected(self, request) -> bool:
+        with self._lock:
+            return request.headers.get("Sec-Fetch-Dest") == "document" or browser_url(request.url) in self._expected
+
+    def inflight(self) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(1 for started in self._inflight.values() if now - started < INFLIGHT_STALE)
+
+    def _is_document(self, request) -> bool:
+        dest = request.headers.get("Sec-Fetch-Dest")
+        if dest is not None:
+            return dest == "document"
+        # http 站点不发送 Sec-Fetch-*,按预期的导航链匹配(两侧都转为浏览器请求形式再比较)
+        return browser_url(request.url) in self._expected
+
+    def response_interceptor(self, request, response):
+        # 运行在 selenium-wire 代理线程
+        with self._lock:
+            self._inflight.pop(request.id, None)
+            if not self._is_document(request):
+                stubbed = self.policy.intercept_response(request, response) if self.policy is not None else 0
+                if stubbed:
+                    self._blocked += 1
+                    self._blocked_bytes += stubbed
+                return
+            location = response.headers.get("Location")
+            hop = {
+                "url": request.url,
+                "status": response.status_code,
+                "location": urljoin(request.url, location) if location else None,
+                "content_type": response.headers.get("Content-Type"),
+                "elapsed": round((response.date - request.date).total_seconds(), 3),
+            }
+            if hop["location"]:
+                self._expected.add(browser_url(hop["location"]))
+            self._hops.append(hop)
+            self._by_url[browser_url(request.url)] = hop
+
+    def record(self, current_url: str = None) -> dict:
+        """
+        :param current_url: driver.current_url,用于定位最终落地页
+        :return: {"url", "final_url", "status", "content_type", "hops", "elapsed", "blocked", "blocked_bytes"}
+        """
+        with self._lock:
+            hops = list(self._hops)
+            final = self._by_url.get(browser_url(current_url)) if current_url else None
+            if final is None and hops:
+                final = hops[-1]
+            return {
+                "url": hops[0]["url"] if hops else None,
+                "final_url": current_url or (final["url"] if final else None),
+                "status": final["status"] if final else None,
+                "content_type": final["content_type"] if final else None,
+                "hops": hops,
+                "elapsed": round(time.time() - self._started, 3),
+                "blocked": self._blocked,
+                "blocked_bytes": self._blocked_bytes,
+            }
+
+
+def begin_navigation(driver, capture: NavigationCapture, url: str):
+    """
+    清空上一个任务的请求历史,开始记录新导航
+    """
+    try:
+        del driver.requests
+    except Exception as e:
+        logging.info(f"清理请求历史失败: {e}")
+    capture.reset(url)
+
+
+# === 页面稳定等待 ===
+SETTLE_SCRIPT = """
+if (!window.__batchurl_observer) {
+    window.__batchurl_last_mutation = Date.now();
+    window.__batchurl_observer = new MutationObserver(function () {
+        window.__batchurl_last_mutation = Date.now();
+    });
+    // 只看节点增删与文本变化,轮播/跑马灯逐帧改写 style/class 不计入
+    window.__batchurl_observer.observe(document, {childList: true, subtree: true, characterData: true});
+}
+return [document.readyState, Date.now() - window.__batchurl_last_mutation];
+"""
+
+
+def wait_for_settle(driver, capture: NavigationCapture, max_wait=SETTLE_MAX_WAIT, quiet=SETTLE_QUIET) -> float:
+    """
+    替代固定 sleep: readyState 为 complete、无在途请求且 DOM 静默 quiet 秒后即返回
+    :return: 实际等待秒数
+    """
+    start = time.time()
+    while True:
+        elapsed = time.time() - start
+        try:
+            ready_state, idle_ms = driver.execute_script(SETTLE_SCRIPT)
+        except JavascriptException as e:
+            # 浏览器内置错误页/非 HTML 文档无法注入脚本,视为已稳定
+            logging.info(f"页面稳定检测脚本异常: {e}")
+            break
+        if ready_state == "complete" and idle_ms >= quiet * 1000 and capture.inflight() == 0:
+            break
+        if elapsed >= max_wait:
+            logging.info(f"页面稳定等待达到上限 {max_wait}s: {driver.current_url}")
+            break
+        time.sleep(SETTLE_POLL)
+    return round(time.time() - start, 3)
+
+
+# === 获取状态码 ===
+def get_status_code(driver, capture: NavigationCapture):
+    try:
+        nav = capture.record(driver.current_url)
+        if nav["status"] is not None:
+            logging.info(f"获取 HTTP 响应码: {nav['status']}:{nav['final_url']}")
+            return nav["status"], nav
+    except Exception as e:
+        logging.exception(f"获取 HTTP 响应码失败: {str(e)}")
+        nav = None
+    return -1, nav
+
+
+# === 浏览器生命周期管理 ===
+class ManagedBrowser:
+    def __init__(self, driver, policy=None):
+        self.driver = driver
+        self.capture = NavigationCapture.attach(driver, policy)
+        self.pages = 0
+
+    def rss_mb(self) -> float:
+        """
+        geckodriver 及其 Firefox 子进程的内存占用,未安装 psutil 时返回 0
+        """
+        try:
+            pid = self.driver.service.process.pid
+        except AttributeError:
+            return 0
+        return tree_rss_mb(pid) or 0
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.info(f"关闭浏览器异常: {e}")
+        profile_dir = getattr(self.driver, "profile_dir", None)
+        if profile_dir:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    浏览器池: 按页面数/内存回收实例,检测失效会话并重建,
+    替换实例在后台预先启动,工作线程无需等待冷启动;
+    启动前可 prewarm 并行拉起整批实例,各实例复制缓存的配置模板启动
+    """
+
+    def __init__(self, max_pages=BROWSER_MAX_PAGES, max_rss_mb=BROWSER_MAX_RSS_MB, factory=create_browser, policy=None,
+                 profile_cache=True):
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.factory = factory
+        self.policy = policy
+        self.profile_cache = profile_cache
+        self._profile = None
+        self._executor = ThreadPoolExecutor(max_workers=BROWSER_LAUNCH_WORKERS, thread_name_prefix="browser-spawn")
+        self._lock = threading.Lock()
+        self._warm = []
+        self._spare = None
+        self._closed = False
+
+    def _template(self):
+        if not self.profile_cache:
+            return None
+        if self._profile is None:
+            try:
+                self._profile = profile_template(browser_prefs(self.policy))
+            except OSError as e:
+                logging.warning(f"Firefox 配置模板不可用,使用默认配置: {e}")
+                self.profile_cache = False
+        return self._profile
+
+    def _launch(self) -> ManagedBrowser:
+        return ManagedBrowser(self.factory(policy=self.policy, profile=self._template()), self.policy)
+
+    def prewarm(self, count: int):
+        """
+        后台并行启动 count 个实例,供工作线程 acquire 时直接取用
+        """
+        with self._lock:
+            if self._closed:
+                return
+            for _ in range(count):
+                self._warm.append(self._executor.submit(self._launch))
+
+    def _ensure_spare(self):
+        with self._lock:
+            if self._spare is None and not self._closed:
+                self._spare = self._executor.submit(self._launch)
+
+    def acquire(self) -> ManagedBrowser:
+        with self._lock:
+            if self._warm:
+                spare = self._warm.pop(0)
+            else:
+                spare, self._spare = self._spare, None
+        if spare is not None:
+            try:
+                return spare.result()
+            except Exception as e:
+                logging.warning(f"预启动浏览器失败,重新创建: {e}")
+        return self._launch()
+
+    def release(self, browser: ManagedBrowser):
+        if browser is not None:
+            self._executor.submit(browser.quit)
+
+    def replace(self, browser: ManagedBrowser, reason: str) -> ManagedBrowser:
+        logging.info(f"回收浏览器({reason}),已处理页面: {browser.pages}")
+        self.release(browser)
+        return self.acquire()
+
+    def is_alive(self, browser: ManagedBrowser) -> bool:
+        try:
+            process = browser.driver.service.process
+            if process is not None and process.poll() is not None:
+                return False
+            browser.driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+        except Exception as e:
+            logging.info(f"浏览器健康检查异常: {e}")
+            return False
+
+    def checkin(self, browser: ManagedBrowser) -> ManagedBrowser:
+        """
+        每处理完一个任务调用,必要时返回替换后的新实例
+        """
+        browser.pages += 1
+        if browser.pages >= self.max_pages:
+            return self.replace(browser, "页面数达到上限")
+        if self.max_rss_mb:
+            rss = browser.rss_mb()
+            if rss >= self.max_rss_mb:
+                return self.replace(browser, f"内存 {rss:.0f}MB 超过上限")
+            if rss >= self.max_rss_mb * 0.8:
+                self._ensure_spare()
+        # 临近回收时后台预热替换实例
+        if browser.pages >= self.max_pages * 0.9:
+            self._ensure_spare()
+        return browser
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            spares = self._warm + ([self._spare] if self._spare is not None else [])
+            self._warm, self._spare = [], None
+        for spare in spares:
+            try:
+                spare.result().quit()
+            except Exception:
+                pass
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    pass
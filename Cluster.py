@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import base64
+import socket
+import logging
+import threading
+import socketserver
+from collections import deque
+
+# === 配置 ===
+CLUSTER_BIND = "127.0.0.1:8765"
+# 每次租约派发的任务数 / 租约无进展多少秒后收回重新派发
+LEASE_SIZE = 20
+LEASE_TTL = 300
+# 任务派完但仍有租约未完成时,工作节点的重试间隔(秒)
+LEASE_WAIT = 2
+# 全部完成后等待工作节点断开的最长时间(秒)
+SHUTDOWN_GRACE = 5
+# 回传给协调节点的结果字段
+RESULT_FIELDS = ("id", "url", "status", "settle", "http_status", "screenshot", "blocked", "blocked_bytes", "timings",
+                 "note", "duplicate_of")
+
+
+def parse_address(address: str):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def _send(sock, lock, message: dict):
+    data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    with lock:
+        sock.sendall(data)
+
+
+# === 协调节点 ===
+class Coordinator:
+    """
+    协调节点: 持有任务队列,按租约分批派发给工作节点,汇总回传结果;
+    租约超时无进展或节点断开时,未完成的任务重新入队派发,重复回传的结果只取第一份
+    """
+
+    def __init__(self, tasks, on_result, bind=CLUSTER_BIND, lease_size=LEASE_SIZE, lease_ttl=LEASE_TTL, key=None,
+                 thumbs_dir=None, prefix=""):
+        """
+        :param on_result: 每个目标首次回传结果时调用,缩略图已落地为本地文件
+        :param key: 共享口令,设置后工作节点握手须携带
+        """
+        self.bind = parse_address(bind)
+        self.lease_size = lease_size
+        self.lease_ttl = lease_ttl
+        self.key = key
+        self.thumbs_dir = thumbs_dir
+        self.prefix = prefix
+        self.on_result = on_result
+        self.requeued = 0
+        self._tasks = {task["id"]: task for task in tasks}
+        self._pending = deque(self._tasks)
+        self._leases = {}
+        self._done = set()
+        self._lock = threading.Lock()
+        self._lease_seq = 0
+        self._finished = threading.Event()
+        self._workers = set()
+        if not self._tasks:
+            self._finished.set()
+
+    def serve(self):
+        """
+        阻塞直至全部任务完成
+        """
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator._handle(self.connection, self.rfile, self.client_address)
+
+        server = socketserver.ThreadingTCPServer(self.bind, Handler, bind_and_activate=False)
+        server.daemon_threads = True
+        server.allow_reuse_address = True
+        server.server_bind()
+        server.server_activate()
+        threading.Thread(target=server.serve_forever, name="coordinator", daemon=True).start()
+        print(f"🛰️ 协调节点监听 {self.bind[0]}:{self.bind[1]},待派发: {len(self._pending)}")
+        while not self._finished.wait(1):
+            self._expire()
+        deadline = time.time() + SHUTDOWN_GRACE
+        while self._workers and time.time() < deadline:
+            time.sleep(0.2)
+        server.shutdown()
+        server.server_close()
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            for lease_id, lease in list(self._leases.items()):
+                if lease["deadline"] <= now:
+                    logging.warning(f"租约 {lease_id}({lease['worker']}) 超时,{len(lease['ids'])} 个任务重新派发")
+                    self._release(lease_id)
+
+    def _release(self, lease_id):
+        lease = self._leases.pop(lease_id)
+        remaining = [idx for idx in lease["ids"] if idx not in self._done]
+        # 收回的任务优先派发
+        self._pending.extendleft(reversed(remaining))
+        self.requeued += len(remaining)
+
+    def _lease(self, worker: str, count: int) -> dict:
+        with self._lock:
+            if self._finished.is_set():
+                return {"op": "done"}
+            ids = []
+            while self._pending and len(ids) < min(count, self.lease_size):
+                idx = self._pending.popleft()
+                if idx not in self._done:
+                    ids.append(idx)
+            if not ids:
+                return {"op": "wait", "delay": LEASE_WAIT}
+            self._lease_seq += 1
+            lease_id = self._lease_seq
+            self._leases[lease_id] = {"ids": set(ids), "worker": worker, "deadline": time.time() + self.lease_ttl}
+            return {"op": "batch", "lease": lease_id, "tasks": [self._tasks[idx] for idx in ids]}
+
+    def _store_thumbnail(self, result: dict, data: str):
+        if not data or not self.thumbs_dir:
+            return None
+        path = os.path.abspath(os.path.join(self.thumbs_dir, f"{self.prefix}_{result['id']}.png"))
+        with open(path, "wb") as f:
+            f.write(base64.b64decode(data))
+        return path
+
+    def _result(self, worker: str, message: dict):
+        result = message["result"]
+        with self._lock:
+            idx = result.get("id")
+            if idx not in self._tasks or idx in self._done:
+                return
+            self._done.add(idx)
+            lease = self._leases.get(message.get("lease"))
+            if lease is not None:
+                lease["ids"].discard(idx)
+                lease["deadline"] = time.time() + self.lease_ttl
+                if not lease["ids"]:
+                    del self._leases[message["lease"]]
+            finished = len(self._done) == len(self._tasks)
+        result["image"] = self._store_thumbnail(result, message.get("thumbnail"))
+        if result.get("screenshot"):
+            # 存档截图留在工作节点本地
+            result["screenshot"] = f"{worker}:{result['screenshot']}"
+        try:
+            self.on_result(result)
+        except Exception as e:
+            logging.exception(f"处理回传结果异常 {result.get('url')}: {e}")
+        if finished:
+            self._finished.set()
+
+    def _handle(self, conn, rfile, address):
+        lock = threading.Lock()
+        worker = f"{address[0]}:{address[1]}"
+        try:
+            hello = json.loads(rfile.readline() or b"{}")
+            if hello.get("op") != "hello" or (self.key and hello.get("key") != self.key):
+                _send(conn, lock, {"op": "reject"})
+                logging.warning(f"拒绝工作节点 {worker}: 握手失败")
+                return
+            worker = hello.get("name") or worker
+            with self._lock:
+                self._workers.add(worker)
+            logging.info(f"工作节点接入: {worker}")
+            _send(conn, lock, {"op": "welcome"})
+            for line in rfile:
+                message = json.loads(line)
+                if message["op"] == "lease":
+                    _send(conn, lock, self._lease(worker, message.get("count", self.lease_size)))
+                elif message["op"] == "result":
+                    self._result(worker, message)
+        except (OSError, ValueError, KeyError) as e:
+            logging.info(f"工作节点 {worker} 连接异常: {e}")
+        finally:
+            with self._lock:
+                self._workers.discard(worker)
+                # 节点断开,其租约立即收回
+                for lease_id, lease in list(self._leases.items()):
+                    if lease["worker"] == worker:
+                        self._release(lease_id)
+            logging.info(f"工作节点断开: {worker}")
+
+
+# === 工作节点 ===
+class ClusterWorker:
+    """
+    工作节点: 本地待处理任务不足时向协调节点申请租约,任务放入本地调度器,
+    结果(含缩略图)逐条回传;协调节点通知完成或断开时关闭调度器
+    """
+
+    def __init__(self, address: str, scheduler, name=None, lease_size=LEASE_SIZE, low_water=1, key=None):
+        """
+        :param scheduler: open_ended 的 HostScheduler
+        :param low_water: 本地待处理任务少于该值时申请新租约
+        """
+        self.address = parse_address(address)
+        self.scheduler = scheduler
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_size = lease_size
+        self.low_water = max(1, low_water)
+        self.key = key
+        self.sent = 0
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._thread = threading.Thread(target=self._feed, name="cluster-feed", daemon=True)
+
+    def start(self):
+        self._sock = socket.create_connection(self.address)
+        self._rfile = self._sock.makefile("rb")
+        _send(self._sock, self._lock, {"op": "hello", "name": self.name, "key": self.key})
+        reply = json.loads(self._rfile.readline() or b"{}")
+        if reply.get("op") != "welcome":
+            raise ConnectionError("协调节点拒绝接入,请检查 --cluster-key")
+        print(f"🛰️ 已接入协调节点 {self.address[0]}:{self.address[1]},节点名: {self.name}")
+        self._thread.start()
+        return self
+
+    def _feed(self):
+        try:
+            while True:
+                if self.scheduler.qsize() >= self.low_water:
+                    time.sleep(0.5)
+                    continue
+                _send(self._sock, self._lock, {"op": "lease", "count": self.lease_size})
+                line = self._rfile.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                if reply["op"] == "batch":
+                    for task in reply["tasks"]:
+                        self._leases[task["id"]] = reply["lease"]
+                        self.scheduler.put(task)
+                elif reply["op"] == "wait":
+                    time.sleep(reply.get("delay", LEASE_WAIT))
+                else:
+                    break
+        except (OSError, ValueError) as e:
+            logging.warning(f"与协调节点的连接中断: {e}")
+        # 不再有新任务,本地任务处理完后工作线程退出
+        self.scheduler.close()
+
+    def put(self, result: dict):
+        message = {"op": "result", "lease": self._leases.pop(result["id"], None),
+                   "result": {k: result.get(k) for k in RESULT_FIELDS}}
+        if result.get("image") and os.path.exists(result["image"]):
+            with open(result["image"], "rb") as f:
+                message["thumbnail"] = base64.b64encode(f.read()).decode("ascii")
+        try:
+            _send(self._sock, self._lock, message)
+            self.sent += 1
+        except OSError as e:
+            # 协调节点会在租约超时后重新派发
+            logging.warning(f"结果回传失败 {result.get('url')}: {e}")
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+            self._sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,110 @@
+import hashlib
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit
+from JudgeCache import VOLATILE_RE
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def navigation_url(url: str) -> str:
+    """
+    实际访问的地址: 保留原始输入,仅在缺少协议时补全 http://
+    """
+    url = url.strip()
+    return url if "://" in url else f"http://{url}"
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    规范化形式,仅用于生成去重键与主机名: 协议/主机小写,去掉默认端口,空路径补 /;
+    保留 IPv6 方括号、用户名密码与 #/ #! 形式的前端路由,其他 fragment 丢弃
+    """
+    parts = urlsplit(navigation_url(url))
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+        netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    except ValueError:
+        # 端口非法时原样保留,不与其他目标合并
+        netloc = parts.netloc.rpartition("@")[2].lower()
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    fragment = parts.fragment if parts.fragment[:1] in ("/", "!") else ""
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, fragment))
+
+
+def target_key(url: str) -> str:
+    """
+    去重键: 忽略协议,http/https 访问同一主机同一路径视为同一目标
+    """
+    parts = urlsplit(canonicalize_url(url))
+    key = f"url:{parts.netloc}{parts.path}?{parts.query}"
+    return f"{key}#{parts.fragment}" if parts.fragment else key
+
+
+def content_key(html: str) -> str:
+    return "content:" + hashlib.sha1(VOLATILE_RE.sub("", html or "").encode("utf-8", "ignore")).hexdigest()
+
+
+class DedupIndex:
+    """
+    去重索引: 输入地址、跳转后的最终地址、页面内容哈希任一命中已处理的目标,
+    则该任务不再截图/判定,复用首个目标的结果,并在报告中标注"重复 #id"
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owner = {}
+        self._done = {}
+        self._followers = defaultdict(list)
+        self.duplicates = 0
+
+    def claim(self, keys: list, idx: int):
+        """
+        :return: 已占用任一键的首个目标 id;均未占用时登记为 idx 所有并返回 None
+        """
+        with self._lock:
+            for key in keys:
+                owner = self._owner.get(key)
+                if owner is not None and owner != idx:
+                    return owner
+            for key in keys:
+                self._owner[key] = idx
+            return None
+
+    def _fill(self, record: dict, primary: dict) -> dict:
+        record.update({
+            "status": primary["status"],
+            "image": primary.get("image"),
+            "screenshot": primary.get("screenshot"),
+            "http_status": primary.get("http_status"),
+            "note": f"重复 #{primary['id']}",
+            "duplicate_of": primary["id"],
+        })
+        return record
+
+    def follow(self, primary_id: int, record: dict):
+        """
+        登记重复任务,首个目标已完成时直接返回填好的结果行,否则等其完成后由 complete 返回
+        """
+        with self._lock:
+            self.duplicates += 1
+            primary = self._done.get(primary_id)
+            if primary is None:
+                self._followers[primary_id].append(record)
+                return None
+            return self._fill(record, primary)
+
+    def complete(self, result: dict) -> list:
+        """
+        目标结果产出时调用,返回等待该结果的重复任务行
+        """
+        with self._lock:
+            self._done[result["id"]] = {k: result.get(k) for k in ("id", "status", "image", "screenshot", "http_status")}
+            primary = self._done[result["id"]]
+            return [self._fill(record, primary) for record in self._followers.pop(result["id"], [])]
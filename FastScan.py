@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from LocalJudge import judge as local_judge, MAX_SCAN_CHARS
+from PreCheck import create_session, USER_AGENT
+from Dedup import navigation_url
+
+# === 配置 ===
+FAST_CONCURRENCY = 1000
+FAST_TIMEOUT = 10
+# 只读取判定所需的前若干字节
+FAST_MAX_BYTES = MAX_SCAN_CHARS
+# requests 回退模式下的线程数上限
+FALLBACK_THREADS = 256
+
+
+def _load_httpx():
+    """
+    :return: (httpx 模块或 None, 是否支持 HTTP/2)
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None, False
+    try:
+        import h2
+        return httpx, True
+    except ImportError:
+        return httpx, False
+
+
+def _error_status(exc: Exception) -> str:
+    message = str(exc).lower()
+    if "timed out" in message or "timeout" in message or type(exc).__name__.endswith("Timeout"):
+        return "无法访问(访问超时)"
+    if "name or service not known" in message or "getaddrinfo" in message or "nodename nor servname" in message:
+        return "无法访问(DNS解析失败)"
+    if "refused" in message:
+        return "无法访问(连接被拒绝)"
+    return "无法访问(其他异常)"
+
+
+async def _fetch_httpx(client, url: str, max_bytes: int):
+    async with client.stream("GET", url) as resp:
+        body = bytearray()
+        async for chunk in resp.aiter_bytes():
+            body.extend(chunk)
+            if len(body) >= max_bytes:
+                break
+        return resp.status_code, str(resp.url), body.decode(resp.encoding or "utf-8", errors="replace")
+
+
+def _fetch_requests(session, url: str, timeout: float, max_bytes: int):
+    resp = session.get(url, allow_redirects=True, timeout=timeout, stream=True)
+    try:
+        body = bytearray()
+        for chunk in resp.iter_content(64 * 1024):
+            body.extend(chunk)
+            if len(body) >= max_bytes:
+                break
+        return resp.status_code, resp.url, body.decode(resp.encoding or "utf-8", errors="replace")
+    finally:
+        resp.close()
+
+
+async def _scan_all(tasks, on_result, concurrency, timeout, judge_executor, max_bytes):
+    loop = asyncio.get_running_loop()
+    pending = iter(tasks)
+    # 回调可能阻塞(写入队列已满),放到单独线程依次执行,不占用事件循环
+    callback = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fastscan-result")
+    httpx, http2 = _load_httpx()
+    if httpx is not None:
+        client = httpx.AsyncClient(http2=http2, verify=False, follow_redirects=True, timeout=timeout,
+                                   headers={"User-Agent": USER_AGENT},
+                                   limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+        fetch = lambda url: _fetch_httpx(client, url, max_bytes)
+        close = client.aclose
+    else:
+        threads = min(concurrency, FALLBACK_THREADS)
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="fastscan")
+        session = create_session(threads)
+        fetch = lambda url: loop.run_in_executor(executor, _fetch_requests, session, url, timeout, max_bytes)
+
+        async def close():
+            session.close()
+            executor.shutdown(wait=False)
+
+    async def worker():
+        # 固定数量的协程依次领取任务,内存只与并发数相关,与目标总数无关
+        for task in pending:
+            result = {"id": task["id"], "url": task["url"], "alive": False, "status": None, "http_status": None,
+                      "final_url": None, "reason": None}
+            try:
+                result["http_status"], result["final_url"], html = await fetch(navigation_url(task["url"]))
+                result["alive"] = True
+            except Exception as e:
+                result["status"] = _error_status(e)
+                logging.info(f"快速模式访问失败 {task['url']}: {e}")
+            else:
+                kind, result["reason"] = await loop.run_in_executor(judge_executor, local_judge, html, result["http_status"])
+                result["status"] = kind
+            await loop.run_in_executor(callback, on_result, result)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(tasks)))))
+    finally:
+        await close()
+        callback.shutdown(wait=True)
+
+
+def fast_scan(tasks, on_result, concurrency=FAST_CONCURRENCY, timeout=FAST_TIMEOUT, judge_executor=None,
+              max_bytes=FAST_MAX_BYTES):
+    """
+    无浏览器快速模式: 异步 GET 首页,按 HTML 与状态码做本地判定
+    :param tasks: [{"id", "url"}, ...]
+    :param on_result: 每个目标完成时在同一个回调线程中依次调用,参数含 alive/status/http_status/final_url/reason,
+                      存活目标的 status 为类型序号
+    :param judge_executor: 执行本地判定的进程池,为空则在默认线程池中执行
+    """
+    if not tasks:
+        return
+    if _load_httpx()[0] is None:
+        logging.info("未安装 httpx,快速模式退回 requests 线程池")
+    asyncio.run(_scan_all(tasks, on_result, concurrency, timeout, judge_executor, max_bytes))
+
+
+if __name__ == "__main__":
+    pass
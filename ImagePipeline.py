@@ -0,0 +1,89 @@
+import io
+import os
+import math
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from JudgeCache import dhash
+
+# === 配置 ===
+TARGET_IMG_HIGHT = 200
+ARCHIVE_FORMAT = "png"
+ARCHIVE_QUALITY = 80
+IMAGE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 与 AISupport.token_calculate 一致: 28x28 像素约 1 token,单图最多 1280 个
+AI_MAX_PIXELS = 1280 * 28 * 28
+
+ARCHIVE_EXT = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+_executor = None
+
+
+def get_executor(max_workers=IMAGE_WORKERS) -> ProcessPoolExecutor:
+    """
+    图片处理进程池,统一使用 spawn,避免在多线程进程中 fork
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _ai_size(width: int, height: int, max_tokens: int):
+    """
+    AI 图片尺寸: 对齐 28 的倍数,像素数不超过 token 预算
+    """
+    max_pixels = min(AI_MAX_PIXELS, max(max_tokens - 2, 4) * 28 * 28)
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    return max(56, int(width * scale // 28 * 28)), max(56, int(height * scale // 28 * 28))
+
+
+def _save_archive(img, path: str, archive_format: str, quality: int):
+    if archive_format == "jpeg":
+        img.save(path, format="JPEG", quality=quality)
+    elif archive_format == "webp":
+        img.save(path, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(path, format="PNG")
+
+
+def process_screenshot(png_bytes: bytes, archive_base: str, thumb_path: str, ai_path: str = None,
+                       archive_format=ARCHIVE_FORMAT, quality=ARCHIVE_QUALITY, thumb_height=TARGET_IMG_HIGHT,
+                       ai_max_tokens=None) -> dict:
+    """
+    截图只解码一次,一并产出存档图、Excel 缩略图、AI 图片与感知哈希,在进程池中执行
+    :param archive_base: 存档图路径(不含后缀),后缀按 archive_format 决定
+    :param ai_path: AI 图片路径,为空则不生成
+    :return: {"archive", "thumbnail", "ai", "hash", "stddev", "elapsed"}
+    """
+    # PIL 只在图片进程中导入,主进程启动时不加载
+    from PIL import Image, ImageOps, ImageStat
+    started = time.perf_counter()
+    img = Image.open(io.BytesIO(png_bytes))
+    img = img.convert("RGB")
+    width, height = img.size
+
+    archive_path = archive_base + ARCHIVE_EXT.get(archive_format, ".png")
+    _save_archive(img, archive_path, archive_format, quality)
+
+    thumb_width = max(1, int(width * thumb_height / float(height)))
+    thumb = img.resize((thumb_width, thumb_height), Image.LANCZOS)
+    # 灰度标准差(加边框前),用于本地白页判定
+    stddev = ImageStat.Stat(thumb.convert("L")).stddev[0]
+    thumb = ImageOps.expand(thumb, border=2, fill='black')
+    thumb.save(thumb_path, format="PNG", compress_level=1)
+
+    if ai_path:
+        ai_width, ai_height = _ai_size(width, height, ai_max_tokens or AI_MAX_PIXELS // (28 * 28) + 2)
+        ai_img = img if (ai_width, ai_height) == (width, height) else img.resize((ai_width, ai_height), Image.LANCZOS)
+        ai_img.save(ai_path, format="PNG", compress_level=1)
+
+    return {"archive": archive_path, "thumbnail": thumb_path, "ai": ai_path, "hash": dhash(img), "stddev": stddev,
+            "elapsed": round(time.perf_counter() - started, 4)}
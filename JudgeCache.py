@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+# === 配置 ===
+JUDGE_CACHE_PATH = "judge_cache.json"
+JUDGE_CACHE_SIZE = 5000
+# 感知哈希(64 bit)汉明距离不超过该值视为同一页面
+JUDGE_CACHE_DISTANCE = 6
+
+TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.I | re.S)
+TAG_RE = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)")
+# 请求 ID、时间戳、会话号等易变内容
+VOLATILE_RE = re.compile(r"[0-9a-f]{8,}|\d+", re.I)
+
+
+def dhash(img) -> int:
+    """
+    差值哈希(dHash): 灰度缩放到 9x8,比较相邻像素明暗,得到 64 bit 指纹
+    """
+    from PIL import Image
+    pixels = list(img.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def image_hash(imgPath: str) -> int:
+    from PIL import Image
+    with Image.open(imgPath) as img:
+        return dhash(img)
+
+
+def html_fingerprint(html: str) -> str:
+    """
+    规范化后的 title + 前 200 个标签序列,忽略数字/随机串等易变内容
+    """
+    html = html or ""
+    match = TITLE_RE.search(html)
+    title = VOLATILE_RE.sub("", match.group(1)).strip().lower() if match else ""
+    tags = ",".join(tag.lower() for tag in TAG_RE.findall(html)[:200])
+    return hashlib.sha1(f"{title}|{tags}".encode("utf-8", "ignore")).hexdigest()
+
+
+class JudgeCache:
+    """
+    AI 判定结果缓存: 以 HTML 指纹分桶,桶内按截图感知哈希的汉明距离匹配近似页面,LRU 淘汰,跨批次持久化
+    """
+
+    def __init__(self, path=JUDGE_CACHE_PATH, max_size=JUDGE_CACHE_SIZE, max_distance=JUDGE_CACHE_DISTANCE):
+        self.path = path
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._index = defaultdict(set)
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for fp, phash, verdict in json.load(f):
+                    self._insert((fp, int(phash, 16)), verdict)
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"判定缓存加载失败,忽略: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = [[fp, f"{phash:016x}", verdict] for (fp, phash), verdict in self._entries.items()]
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _insert(self, key, verdict):
+        self._entries[key] = verdict
+        self._entries.move_to_end(key)
+        self._index[key[0]].add(key[1])
+        while len(self._entries) > self.max_size:
+            (fp, phash), _ = self._entries.popitem(last=False)
+            self._index[fp].discard(phash)
+            if not self._index[fp]:
+                del self._index[fp]
+
+    @staticmethod
+    def key(imgPath: str, html: str, phash: int = None):
+        """
+        :param phash: 图片流水线已算好的感知哈希,为空时读取 imgPath 计算
+        """
+        return html_fingerprint(html), phash if phash is not None else image_hash(imgPath)
+
+    def get(self, key):
+        fp, phash = key
+        with self._lock:
+            best, best_distance = None, self.max_distance + 1
+            for candidate in self._index.get(fp, ()):
+                distance = bin(candidate ^ phash).count("1")
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end((fp, best))
+            return self._entries[(fp, best)]
+
+    def put(self, key, verdict: str):
+        with self._lock:
+            self._insert(key, verdict)
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return f"命中 {self.hits} / 未命中 {self.misses} (命中率 {rate:.0%})"
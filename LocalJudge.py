@@ -0,0 +1,156 @@
+import re
+from html.parser import HTMLParser
+
+# === 配置 ===
+# 最多扫描的 HTML 字符数 / 分块大小 / 保留用于特征匹配的可见文本长度
+MAX_SCAN_CHARS = 512 * 1024
+FEED_CHUNK = 64 * 1024
+MAX_TEXT_CHARS = 4096
+# 截图灰度标准差低于该值视为白页(单一色彩)
+BLANK_STDDEV = 2.0
+# 无截图时: 可见文本与标签都极少视为白页
+BLANK_MAX_TAGS = 10
+# 通用错误文案只在 title 中匹配,标签数不超过该值的简单错误页才匹配正文
+SPARSE_MAX_TAGS = 40
+
+SKIP_TEXT_TAGS = {"script", "style", "noscript", "template"}
+LOGIN_FIELD_RE = re.compile(r"user|login|account|passw|pwd|captcha|验证码|账号|帐号|用户名|密码", re.I)
+LOGIN_TITLE_RE = re.compile(r"登录|登陆|login|log in|sign in|signin|统一身份认证|单点登录|\bsso\b|认证中心", re.I)
+ERROR_TITLE_KEYWORDS = ["404", "not found", "403", "forbidden", "502", "bad gateway", "error"]
+
+# === 特征库 ===
+# (类型序号, 说明, 正则),匹配对象为 title + 可见文本
+SIGNATURES = [(kind, name, re.compile(pattern, re.I)) for kind, name, pattern in [
+    # 中间件/面板欢迎页
+    ("4", "nginx", r"welcome to nginx|welcome to openresty|welcome to tengine"),
+    ("4", "IIS", r"iis windows server|internet information services|iis\d* welcome"),
+    ("4", "apache", r"apache2 (ubuntu|debian|centos)? ?default page|test page for the (apache|nginx) http server"
+                    r"|^\s*it works!?\s*$|this page is used to test the proper operation of"),
+    ("4", "tomcat", r"^\s*apache tomcat(/[\d.]+)?\s*$|if you're seeing this,? you've successfully installed tomcat"),
+    ("4", "jboss/wildfly", r"welcome to (jboss|wildfly)"),
+    ("4", "jetty", r"powered by jetty://\s*$"),
+    ("4", "caddy", r"caddy works!|congratulations.{0,40}caddy"),
+    ("4", "os default", r"welcome to (centos|fedora|the red hat enterprise linux)"),
+    ("4", "宝塔/面板", r"恭喜.{0,4}站点创建成功|phpstudy|默认站点"),
+    # WAF 拦截页
+    ("3", "cloudflare", r"attention required! \| cloudflare|cloudflare ray id|error 10\d\d .{0,40}cloudflare"),
+    ("3", "waf", r"request rejected|the requested url was rejected|web application firewall|网站防火墙|安全狗|云锁"
+                 r"|web应用防火墙|可能对网站造成安全威胁|疑似黑客攻击|您的访问被阻断|已被拦截|errors\.aliyun\.com"),
+    # 框架自带错误页
+    ("3", "app error", r"whitelabel error page|server error in '/' application|error 404--not found"),
+    ("3", "站点异常", r"没有找到站点|站点已暂停|网站暂时无法访问|该网站暂时无法访问|域名未备案|站点已停止"),
+]]
+# 通用错误文案,正常页面的链接/提示里也常出现,只匹配 title 或简单页面的正文
+TITLE_SIGNATURES = [(kind, name, re.compile(pattern, re.I)) for kind, name, pattern in [
+    ("3", "http error", r"\b(400 bad request|401 unauthorized|403 forbidden|404 not found|500 internal server error"
+                        r"|502 bad gateway|503 service (temporarily )?unavailable|504 gateway time-?out)\b"),
+    ("3", "app error", r"http status \d{3}|page not found|页面不存在|找不到页面|您访问的页面不存在"),
+]]
+
+
+class PageScanner(HTMLParser):
+    """
+    流式扫描 HTML,只统计判定所需的信息: title、标签数、表单/密码框、可见文本片段
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tag_count = 0
+        self.forms = 0
+        self.password_inputs = 0
+        self.login_fields = 0
+        self.title = ""
+        self._text = []
+        self._text_len = 0
+        self._in_title = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.tag_count += 1
+        if tag == "title":
+            self._in_title = True
+        elif tag in SKIP_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == "form":
+            self.forms += 1
+        elif tag == "input":
+            attrs = dict(attrs)
+            if (attrs.get("type") or "").lower() == "password":
+                self.password_inputs += 1
+            hint = " ".join(attrs.get(k) or "" for k in ("name", "id", "placeholder"))
+            if LOGIN_FIELD_RE.search(hint):
+                self.login_fields += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in SKIP_TEXT_TAGS:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in SKIP_TEXT_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth or self._text_len >= MAX_TEXT_CHARS:
+            return
+        data = data.strip()
+        if data:
+            self._text.append(data)
+            self._text_len += len(data)
+
+    @property
+    def text(self) -> str:
+        return " ".join(self._text)[:MAX_TEXT_CHARS]
+
+
+def scan_html(html: str) -> PageScanner:
+    scanner = PageScanner()
+    html = html or ""
+    for start in range(0, min(len(html), MAX_SCAN_CHARS), FEED_CHUNK):
+        scanner.feed(html[start:start + FEED_CHUNK])
+    scanner.close()
+    return scanner
+
+
+def judge(html: str, http_status: int = 0, pixel_stddev: float = None):
+    """
+    本地判定
+    :param pixel_stddev: 截图灰度标准差,为空时按 HTML 结构判断白页
+    :return: (类型序号, 判定依据)
+    """
+    if http_status and http_status >= 400:
+        return "3", f"HTTP {http_status}"
+
+    scanner = scan_html(html)
+    title = " ".join(scanner.title.split()).lower()
+    text = scanner.text
+
+    for kind, name, pattern in SIGNATURES:
+        if pattern.search(title) or pattern.search(text):
+            return kind, f"特征 {name}"
+    sparse = scanner.tag_count <= SPARSE_MAX_TAGS
+    for kind, name, pattern in TITLE_SIGNATURES:
+        if pattern.search(title) or (sparse and pattern.search(text)):
+            return kind, f"特征 {name}"
+
+    if pixel_stddev is not None:
+        if pixel_stddev < BLANK_STDDEV:
+            return "5", f"截图单一色彩(标准差 {pixel_stddev:.2f})"
+    elif not text and not title and scanner.tag_count <= BLANK_MAX_TAGS:
+        return "5", "无可见内容"
+
+    if scanner.password_inputs or (LOGIN_TITLE_RE.search(title) and scanner.login_fields):
+        return "2", "登录表单"
+
+    keyword_hit = [kw for kw in ERROR_TITLE_KEYWORDS if kw in title]
+    if keyword_hit:
+        return "3", f"标题关键词 {keyword_hit}"
+
+    return "1", "默认"
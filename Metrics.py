@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === 配置 ===
+# Prometheus textfile 刷新间隔(秒) / HTTP 端点监听地址
+METRICS_INTERVAL = 15
+METRICS_HOST = "127.0.0.1"
+
+# 浏览器阶段依次为: 导航、等待稳定、读取源码、状态码、截图、图片处理、判定、写入
+STAGES = ("navigation", "settle", "page_source", "status", "screenshot", "image", "judge_local", "judge_ai", "write")
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    :param values: 已排序的样本
+    """
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class StageTimer:
+    """
+    单个任务的分阶段计时,同一阶段多次进入时累加
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = round(self.stages.get(name, 0) + seconds, 4)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Metrics:
+    """
+    任务级阶段耗时汇总: 每个结果写入后记录一行 JSONL,结束时输出各阶段 p50/p95/p99、吞吐与线程利用率,
+    可选导出 Prometheus textfile 或 HTTP /metrics 端点供运行中查看
+    """
+
+    def __init__(self, path=None, textfile=None, port=None, interval=METRICS_INTERVAL):
+        """
+        :param path: JSONL 输出文件,为空则只做汇总
+        :param textfile: Prometheus node_exporter textfile 路径
+        :param port: HTTP /metrics 端口
+        """
+        self.textfile = textfile
+        self.port = port
+        self.interval = interval
+        self.tasks = 0
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+        self._status = defaultdict(int)
+        self._busy = 0.0
+        self._alive = 0.0
+        self._started = time.time()
+        self._file = open(path, "w", encoding="utf-8") if path else None
+        self._server = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.port:
+            handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": self})
+            self._server = ThreadingHTTPServer((METRICS_HOST, self.port), handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"📈 指标端点: http://{METRICS_HOST}:{self.port}/metrics")
+        if self.textfile:
+            self._thread = threading.Thread(target=self._export_loop, name="metrics-textfile", daemon=True)
+            self._thread.start()
+        return self
+
+    def record(self, result: dict):
+        """
+        结果写入后调用,result["timings"] 为 StageTimer.stages
+        """
+        timings = result.get("timings") or {}
+        with self._lock:
+            self.tasks += 1
+            self._status[result.get("status")] += 1
+            for stage, seconds in timings.items():
+                self._samples[stage].append(seconds)
+            if self._file is not None:
+                self._file.write(json.dumps({
+                    "ts": round(time.time(), 3),
+                    "id": result.get("id"),
+                    "url": result.get("url"),
+                    "status": result.get("status"),
+                    "http_status": result.get("http_status"),
+                    "blocked": result.get("blocked") or 0,
+                    "blocked_bytes": result.get("blocked_bytes") or 0,
+                    "stages": timings,
+                    "total": round(sum(timings.values()), 4),
+                }, ensure_ascii=False) + "\n")
+
+    def worker_time(self, busy: float, alive: float):
+        """
+        工作线程退出时上报: 处理任务的累计耗时 / 存活时长
+        """
+        with self._lock:
+            self._busy += busy
+            self._alive += alive
+
+    def _snapshot(self):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            return samples, dict(self._status), self.tasks, self._busy, self._alive
+
+    def _ordered(self, samples: dict) -> list:
+        return [stage for stage in STAGES if stage in samples] + sorted(set(samples) - set(STAGES))
+
+    def summary(self, ai_stats: str = None) -> str:
+        samples, _, tasks, busy, alive = self._snapshot()
+        elapsed = time.time() - self._started
+        lines = [f"{'stage':<14}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'total':>10}"]
+        for stage in self._ordered(samples):
+            values = samples[stage]
+            lines.append(f"{stage:<14}{len(values):>8}{percentile(values, 0.5):>9.3f}{percentile(values, 0.95):>9.3f}"
+                         f"{percentile(values, 0.99):>9.3f}{sum(values):>10.1f}")
+        lines.append(f"吞吐: {tasks / elapsed if elapsed else 0:.2f} URL/s, 线程利用率: {busy / alive if alive else 0:.0%}")
+        if ai_stats:
+            lines.append(f"AI 调用: {ai_stats}")
+        return "\n".join(lines)
+
+    def prometheus(self) -> str:
+        samples, status, tasks, busy, alive = self._snapshot()
+        elapsed = time.time() - self._started
+        lines = ["# TYPE batchurl_tasks_total counter"]
+        for name, count in status.items():
+            lines.append(f'batchurl_tasks_total{{status="{_label(name)}"}} {count}')
+        lines.append("# TYPE batchurl_stage_seconds summary")
+        for stage in self._ordered(samples):
+            values = samples[stage]
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'batchurl_stage_seconds{{stage="{stage}",quantile="{q}"}} {percentile(values, q)}')
+            lines.append(f'batchurl_stage_seconds_sum{{stage="{stage}"}} {sum(values)}')
+            lines.append(f'batchurl_stage_seconds_count{{stage="{stage}"}} {len(values)}')
+        lines.append("# TYPE batchurl_urls_per_second gauge")
+        lines.append(f"batchurl_urls_per_second {tasks / elapsed if elapsed else 0}")
+        lines.append("# TYPE batchurl_worker_utilization gauge")
+        lines.append(f"batchurl_worker_utilization {busy / alive if alive else 0}")
+        return "\n".join(lines) + "\n"
+
+    def _write_textfile(self):
+        tmp = f"{self.textfile}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp, self.textfile)
+
+    def _export_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._write_textfile()
+            except OSError as e:
+                logging.warning(f"写入指标文件失败: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.textfile:
+            self._write_textfile()
+        if self._server is not None:
+            self._server.shutdown()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,172 @@
+import errno
+import asyncio
+import socket
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# === 配置 ===
+PRECHECK_CONCURRENCY = 200
+PRECHECK_TIMEOUT = 5
+# 多地址目标依次发起连接的错开间隔(秒),同 Firefox 的 Happy Eyeballs 回退
+HAPPY_EYEBALLS_DELAY = 0.25
+UNREACHABLE_ERRNOS = (errno.ENETUNREACH, errno.EHOSTUNREACH)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+
+def _target(url: str):
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        return None, None
+    if port is None:
+        port = 443 if parts.scheme == "https" else 80
+    return parts.hostname, port
+
+
+def _interleave(infos) -> list:
+    """
+    解析结果去重后按地址族交替排列(IPv6/IPv4 轮流),与浏览器的尝试顺序一致
+    """
+    families = {}
+    for family, _, _, _, sockaddr in infos:
+        addrs = families.setdefault(family, [])
+        if sockaddr[0] not in addrs:
+            addrs.append(sockaddr[0])
+    ordered = []
+    groups = list(families.values())
+    while any(groups):
+        for addrs in groups:
+            if addrs:
+                ordered.append(addrs.pop(0))
+    return ordered
+
+
+async def _open(addr: str, port: int):
+    _, writer = await asyncio.open_connection(addr, port)
+    writer.close()
+
+
+async def _connect_any(addrs: list, port: int) -> list:
+    """
+    错开发起连接,依次尝试全部解析地址,任一地址连通即成功
+    :return: 成功返回空列表,全部失败返回各地址的异常
+    """
+    queue = list(addrs)
+    running = set()
+    errors = []
+    try:
+        while queue or running:
+            if queue:
+                running.add(asyncio.ensure_future(_open(queue.pop(0), port)))
+            done, running = await asyncio.wait(running, timeout=HAPPY_EYEBALLS_DELAY if queue else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return []
+                errors.append(task.exception())
+        return errors
+    finally:
+        for task in running:
+            task.cancel()
+
+
+def _connect_status(errors: list) -> str:
+    # 任一地址明确拒绝说明主机可达但端口未开放
+    if any(isinstance(e, ConnectionRefusedError) for e in errors):
+        return "无法访问(连接被拒绝)"
+    if any(getattr(e, "errno", None) in UNREACHABLE_ERRNOS for e in errors):
+        return "无法访问(网络不可达)"
+    return "无法访问(连接失败)"
+
+
+def create_session(pool_size: int) -> "requests.Session":
+    """
+    共享连接池的 Session,各预检线程复用同一组 keep-alive 连接
+    """
+    import requests
+    import urllib3
+    from requests.adapters import HTTPAdapter
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    session.verify = False
+    return session
+
+
+def _http_probe(session: "requests.Session", url: str, timeout: float):
+    resp = session.head(url, allow_redirects=True, timeout=timeout)
+    # 部分服务不支持 HEAD,退回 GET 但不读取响应体
+    if resp.status_code in (405, 501):
+        resp = session.get(url, allow_redirects=True, timeout=timeout, stream=True)
+        resp.close()
+    return resp.status_code, resp.url
+
+
+async def _probe(idx, url, session, semaphore, timeout):
+    result = {"id": idx, "url": url, "alive": False, "status": None, "http_status": None, "final_url": None}
+    host, port = _target(url)
+    if not host:
+        result["status"] = "无法访问(URL无效)"
+        return result
+
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        # DNS 解析
+        try:
+            infos = await asyncio.wait_for(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout)
+        except (socket.gaierror, asyncio.TimeoutError, UnicodeError):
+            result["status"] = "无法访问(DNS解析失败)"
+            return result
+
+        # TCP 建连,双栈主机某一路不通时回退其他地址
+        try:
+            errors = await asyncio.wait_for(_connect_any(_interleave(infos), port), timeout)
+        except asyncio.TimeoutError:
+            result["status"] = "无法访问(访问超时)"
+            return result
+        if errors:
+            result["status"] = _connect_status(errors)
+            logging.info(f"预检 TCP 建连失败 {url}: {errors}")
+            return result
+
+        # 端口可连即视为存活,HTTP 探测失败(TLS 异常等)仍交给浏览器判断
+        result["alive"] = True
+        try:
+            result["http_status"], result["final_url"] = await loop.run_in_executor(None, _http_probe, session, url, timeout)
+        except Exception as e:
+            logging.info(f"预检 HTTP 探测失败 {url}: {e}")
+    return result
+
+
+async def _precheck_all(tasks, concurrency, timeout):
+    loop = asyncio.get_running_loop()
+    # getaddrinfo 与 requests 共用同一线程池,避免默认线程池成为瓶颈
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="precheck")
+    loop.set_default_executor(executor)
+    semaphore = asyncio.Semaphore(concurrency)
+    session = create_session(concurrency)
+    try:
+        results = await asyncio.gather(*(_probe(idx, url, session, semaphore, timeout) for idx, url in tasks))
+    finally:
+        session.close()
+    return {res["id"]: res for res in results}
+
+
+def precheck_urls(tasks, concurrency=PRECHECK_CONCURRENCY, timeout=PRECHECK_TIMEOUT) -> dict:
+    """
+    浏览器访问前的异步预检: DNS 解析 -> TCP 建连 -> HEAD/GET
+    :param tasks: [(idx, url), ...]
+    :return: {idx: {"alive", "status", "http_status", "final_url", ...}}
+    """
+    if not tasks:
+        return {}
+    return asyncio.run(_precheck_all(tasks, concurrency, timeout))
+
+
+if __name__ == "__main__":
+    pass
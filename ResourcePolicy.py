@@ -0,0 +1,115 @@
+import os
+from urllib.parse import urlsplit
+
+# === 配置 ===
+# 默认拦截的资源类别,可选: media,font,tracker,image
+BLOCK_DEFAULT = "media,font,tracker"
+# 超过该大小(KB)的子资源响应替换为空,0 表示不限制
+MAX_RESOURCE_KB = 1024
+
+# Sec-Fetch-Dest -> 类别
+DEST_KINDS = {
+    "video": "media", "audio": "media", "track": "media", "object": "media", "embed": "media",
+    "font": "font",
+    "image": "image",
+}
+# http 站点不发送 Sec-Fetch-*,按后缀判断
+EXT_KINDS = {
+    ".mp4": "media", ".webm": "media", ".m3u8": "media", ".ts": "media", ".flv": "media", ".mov": "media",
+    ".avi": "media", ".mp3": "media", ".ogg": "media", ".wav": "media", ".m4a": "media", ".swf": "media",
+    ".woff": "font", ".woff2": "font", ".ttf": "font", ".otf": "font", ".eot": "font",
+    ".png": "image", ".jpg": "image", ".jpeg": "image", ".gif": "image", ".webp": "image", ".ico": "image",
+}
+# 页面渲染必需的资源不做大小限制
+RENDER_CRITICAL_DESTS = {"document", "iframe", "frame", "script", "style", "worker", "sharedworker"}
+RENDER_CRITICAL_EXTS = {".js", ".mjs", ".css", ".html", ".htm"}
+
+# 统计/广告/埋点域名,匹配自身及子域名
+TRACKER_DOMAINS = (
+    "google-analytics.com", "googletagmanager.com", "googlesyndication.com", "doubleclick.net",
+    "googleadservices.com", "facebook.net", "connect.facebook.com", "hotjar.com", "clarity.ms",
+    "segment.io", "mixpanel.com", "scorecardresearch.com", "newrelic.com", "nr-data.net",
+    "hm.baidu.com", "cnzz.com", "umeng.com", "51.la", "growingio.com", "sensorsdata.cn", "mmstat.com",
+    "tajs.qq.com", "pingjs.qq.com", "zhanzhang.baidu.com", "push.zhanzhang.baidu.com",
+)
+
+# 关闭 Service Worker 与持久缓存,避免跨目标复用缓存/后台请求;禁止媒体自动播放与预取
+FIREFOX_PREFS = {
+    "dom.serviceWorkers.enabled": False,
+    "browser.cache.disk.enable": False,
+    "browser.cache.offline.enable": False,
+    "media.autoplay.default": 5,
+    "media.preload.default": 0,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.predictor.enabled": False,
+    "browser.safebrowsing.malware.enabled": False,
+    "browser.safebrowsing.phishing.enabled": False,
+    "browser.safebrowsing.downloads.enabled": False,
+}
+
+
+class ResourcePolicy:
+    """
+    资源拦截策略: 请求阶段按类别/域名直接返回空响应,响应阶段把超大子资源替换为空,
+    不保存状态,由 NavigationCapture 在 selenium-wire 代理线程中调用并按页面计数
+    """
+
+    def __init__(self, block=BLOCK_DEFAULT, max_resource_kb=MAX_RESOURCE_KB):
+        if isinstance(block, str):
+            block = [kind.strip() for kind in block.split(",")]
+        self.block = {kind for kind in block if kind}
+        self.max_bytes = max_resource_kb * 1024 if max_resource_kb else 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.block or self.max_bytes)
+
+    @staticmethod
+    def _ext(url: str) -> str:
+        return os.path.splitext(urlsplit(url).path)[1].lower()
+
+    def _kind(self, request):
+        dest = request.headers.get("Sec-Fetch-Dest")
+        if dest is not None:
+            return DEST_KINDS.get(dest)
+        return EXT_KINDS.get(self._ext(request.url))
+
+    @staticmethod
+    def _is_tracker(url: str) -> bool:
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == domain or host.endswith("." + domain) for domain in TRACKER_DOMAINS)
+
+    def intercept_request(self, request):
+        """
+        :return: 被拦截时返回类别,否则 None
+        """
+        kind = "tracker" if "tracker" in self.block and self._is_tracker(request.url) else self._kind(request)
+        if kind is None or kind not in self.block:
+            return None
+        request.create_response(status_code=204, headers={"Content-Length": "0"}, body=b"")
+        return kind
+
+    def intercept_response(self, request, response) -> int:
+        """
+        :return: 被替换为空的响应字节数,未替换返回 0
+        """
+        if not self.max_bytes or response.status_code != 200:
+            return 0
+        dest = request.headers.get("Sec-Fetch-Dest")
+        if dest in RENDER_CRITICAL_DESTS or (dest is None and self._ext(request.url) in RENDER_CRITICAL_EXTS):
+            return 0
+        content_type = (response.headers.get("Content-Type") or "").lower()
+        if dest is None and ("html" in content_type or "javascript" in content_type or "css" in content_type):
+            return 0
+        try:
+            size = int(response.headers.get("Content-Length") or len(response.body or b""))
+        except ValueError:
+            size = len(response.body or b"")
+        if size <= self.max_bytes:
+            return 0
+        response.body = b""
+        del response.headers["Content-Encoding"]
+        del response.headers["Content-Length"]
+        response.headers["Content-Length"] = "0"
+        return size
@@ -0,0 +1,142 @@
+import os
+import time
+import sqlite3
+import threading
+from BrowserSupport import normalize_url
+
+# === 配置 ===
+DB_PATH = "batchURL.db"
+# 每写入多少条提交一次事务
+COMMIT_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    url_key        TEXT PRIMARY KEY,
+    url            TEXT NOT NULL,
+    state          TEXT NOT NULL,
+    classification TEXT,
+    http_status    INTEGER,
+    screenshot     TEXT,
+    thumbnail      TEXT,
+    settle         REAL,
+    run_id         TEXT,
+    first_seen     REAL NOT NULL,
+    updated_at     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     TEXT PRIMARY KEY,
+    input      TEXT,
+    started_at REAL NOT NULL,
+    finished   INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+def url_key(url: str) -> str:
+    return normalize_url(url.strip())
+
+
+class ResultStore:
+    """
+    SQLite 结果库: 以规范化 URL 为键保存每个目标的最近一次结果,支持断点续跑与增量复扫
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._pending = 0
+
+    def begin_run(self, run_id: str, input_file: str, resumed=None):
+        """
+        :param resumed: 被续跑的中断批次,新批次继承其开始时间并将其标记为结束
+        """
+        started_at = resumed["started_at"] if resumed is not None else time.time()
+        with self._lock:
+            if resumed is not None:
+                self._conn.execute("UPDATE runs SET finished = 1 WHERE run_id = ?", (resumed["run_id"],))
+            self._conn.execute("INSERT OR REPLACE INTO runs (run_id, input, started_at, finished) VALUES (?, ?, ?, 0)",
+                               (run_id, os.path.abspath(input_file), started_at))
+            self._conn.commit()
+        return started_at
+
+    def finish_run(self, run_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE runs SET finished = 1 WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+
+    def last_unfinished_run(self, input_file: str):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT * FROM runs WHERE input = ? AND finished = 0 ORDER BY started_at DESC LIMIT 1",
+                (os.path.abspath(input_file),)).fetchone()
+
+    def get(self, url: str):
+        with self._lock:
+            return self._conn.execute("SELECT * FROM results WHERE url_key = ?", (url_key(url),)).fetchone()
+
+    def save(self, result: dict, run_id: str):
+        status = result.get("status") or ""
+        state = STATE_FAILED if status.startswith("无法访问") else STATE_DONE
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO results (url_key, url, state, classification, http_status, screenshot, thumbnail,
+                                        settle, run_id, first_seen, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(url_key) DO UPDATE SET
+                       url = excluded.url, state = excluded.state, classification = excluded.classification,
+                       http_status = excluded.http_status, screenshot = excluded.screenshot,
+                       thumbnail = excluded.thumbnail, settle = excluded.settle, run_id = excluded.run_id,
+                       updated_at = excluded.updated_at""",
+                (url_key(result["url"]), result["url"], state, status, result.get("http_status"),
+                 result.get("screenshot"), result.get("image"), result.get("settle"), run_id, now, now))
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self._conn.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def row_to_result(idx: int, row) -> dict:
+    """
+    库中记录转为结果行,缩略图已被清理时不再引用
+    """
+    thumbnail = row["thumbnail"]
+    if thumbnail and not os.path.exists(thumbnail):
+        thumbnail = None
+    return {
+        "id": idx,
+        "url": row["url"],
+        "status": row["classification"],
+        "image": thumbnail,
+        "settle": row["settle"],
+        "http_status": row["http_status"],
+        "screenshot": row["screenshot"],
+        "cached": True
+    }
+
+
+def should_skip(row, resume_since=None, fresh_since=None) -> bool:
+    """
+    :param resume_since: 续跑时中断批次的开始时间,此后写入的记录直接复用
+    :param fresh_since: 复扫时的新鲜度界限,此后成功的记录直接复用,失败/过期的重新访问
+    """
+    if row is None:
+        return False
+    if resume_since is not None and row["updated_at"] >= resume_since:
+        return True
+    if fresh_since is not None and row["state"] == STATE_DONE and row["updated_at"] >= fresh_since:
+        return True
+    return False
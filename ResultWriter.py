@@ -0,0 +1,114 @@
+import time
+import logging
+import threading
+from queue import Queue
+
+# === 配置 ===
+ROW_HEIGHT = 150
+# 单个工作簿最多写入的结果行数,超过后自动切分新文件
+ROWS_PER_FILE = 2000
+# 待写入结果的队列长度,写入跟不上时工作线程阻塞等待
+WRITER_QUEUE_SIZE = 64
+
+HEADER = ["ID", "URL", "访问状态", "截图", "等待(秒)", "备注", "拦截(KB)"]
+COLUMN_WIDTHS = {"A": 6, "B": 50, "C": 20, "D": 45, "E": 10, "F": 16, "G": 10}
+
+
+class ResultWriter:
+    """
+    流式写入 Excel: 结果按完成顺序进入有界队列,由单独线程写入 write-only 工作簿,
+    缩略图以磁盘路径引用,达到行数上限即保存并切分新文件,内存占用与输入规模无关
+    """
+
+    def __init__(self, output_base: str, rows_per_file=ROWS_PER_FILE, queue_size=WRITER_QUEUE_SIZE,
+                 store=None, run_id=None, metrics=None):
+        """
+        :param output_base: 输出文件名(不含后缀),切分后依次为 base.xlsx, base_2.xlsx ...
+        :param store: ResultStore,新产生的结果同时落库
+        :param metrics: Metrics,写入后记录该结果的阶段耗时
+        """
+        self.output_base = output_base
+        self.store = store
+        self.metrics = metrics
+        self.run_id = run_id
+        self.rows_per_file = rows_per_file
+        self.paths = []
+        self.count = 0
+        self._queue = Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._wb = None
+        self._ws = None
+        self._row = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, result: dict):
+        self._queue.put(result)
+
+    def close(self) -> list:
+        self._queue.put(None)
+        self._thread.join()
+        return self.paths
+
+    def _open_book(self):
+        from openpyxl import Workbook
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("访问结果")
+        for col, width in COLUMN_WIDTHS.items():
+            self._ws.column_dimensions[col].width = width
+        self._ws.append(HEADER)
+        self._row = 1
+
+    def _save_book(self):
+        if self._wb is None:
+            return
+        part = len(self.paths) + 1
+        path = f"{self.output_base}.xlsx" if part == 1 else f"{self.output_base}_{part}.xlsx"
+        self._wb.save(path)
+        self.paths.append(path)
+        print(f"\n✅ Excel 文件已保存: {path}")
+        self._wb = None
+        self._ws = None
+
+    def _write(self, res: dict):
+        if self._wb is None:
+            self._open_book()
+        self._row += 1
+        ws, row = self._ws, self._row
+        if res.get("image"):
+            from openpyxl.drawing.image import Image as XLImage
+            ws.add_image(XLImage(res["image"]), f"D{row}")
+            ws.row_dimensions[row].height = ROW_HEIGHT
+            shot = None
+        else:
+            ws.row_dimensions[row].height = 20
+            shot = "（无截图）"
+        blocked_kb = round(res["blocked_bytes"] / 1024) if res.get("blocked_bytes") else None
+        ws.append([res["id"], res["url"], res["status"], shot, res.get("settle"), res.get("note"), blocked_kb])
+        self.count += 1
+        if self._row - 1 >= self.rows_per_file:
+            self._save_book()
+
+    def _run(self):
+        while True:
+            res = self._queue.get()
+            if res is None:
+                break
+            started = time.perf_counter()
+            try:
+                if self.store is not None and not res.get("cached"):
+                    self.store.save(res, self.run_id)
+                self._write(res)
+            except Exception as e:
+                logging.exception(f"写入结果失败 {res.get('url')}: {e}")
+            if self.metrics is not None:
+                res["timings"] = dict(res.get("timings") or {}, write=round(time.perf_counter() - started, 4))
+                self.metrics.record(res)
+        try:
+            if self._wb is None and not self.paths:
+                self._open_book()
+            self._save_book()
+        except Exception as e:
+            logging.exception(f"保存 Excel 失败: {e}")
@@ -0,0 +1,170 @@
+import time
+import heapq
+import itertools
+import threading
+from queue import Empty
+from collections import OrderedDict, deque, defaultdict
+from urllib.parse import urlsplit
+from Dedup import canonicalize_url
+
+# === 配置 ===
+# 同一主机同时访问的浏览器数 / 同一主机两次派发的最小间隔(秒,0 为不限,仅靠并发数限速)
+HOST_CONCURRENCY = 2
+HOST_DELAY = 0
+# 瞬时失败的重试次数 / 首次重试等待(秒),之后每次翻倍
+RETRIES = 2
+RETRY_BACKOFF = 5.0
+# Firefox 错误页中视为瞬时失败的类型
+TRANSIENT_ERRORS = ("netReset", "netTimeout", "netInterrupt")
+
+
+def host_of(url: str) -> str:
+    return urlsplit(canonicalize_url(url)).hostname or url
+
+
+def is_transient(exc: Exception) -> bool:
+    """
+    连接被重置/超时/中断视为瞬时失败,可稍后重试
+    """
+    message = str(getattr(exc, "msg", None) or exc)
+    return any(err in message for err in TRANSIENT_ERRORS)
+
+
+class HostScheduler:
+    """
+    按主机轮转派发任务: 限制单主机并发与派发间隔,瞬时失败按指数退避延后重新入队
+    """
+
+    def __init__(self, tasks=(), host_concurrency=HOST_CONCURRENCY, host_delay=HOST_DELAY, retries=RETRIES,
+                 backoff=RETRY_BACKOFF, open_ended=False):
+        """
+        :param open_ended: 任务由外部陆续放入(如集群租约),清空后不结束,直至调用 close
+        """
+        self.host_concurrency = max(1, host_concurrency)
+        self.host_delay = host_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.retried = 0
+        self._cond = threading.Condition()
+        self._hosts = {}
+        # 可立即派发的主机(按轮转顺序) / 派发间隔未到的主机堆 (可派发时间, 主机);
+        # 并发已满的主机两处都不在,done 时重新排入,取任务无需扫描全部主机
+        self._ready = OrderedDict()
+        self._cooling = []
+        self._slotted = set()
+        self._active = defaultdict(int)
+        self._next_at = defaultdict(float)
+        self._delayed = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._inflight = 0
+        self._open = open_ended
+        for task in tasks:
+            self.put(task)
+
+    def put(self, task: dict):
+        with self._cond:
+            self._enqueue(task)
+            self._cond.notify_all()
+
+    def _enqueue(self, task: dict):
+        host = task.setdefault("host", host_of(task["url"]))
+        self._hosts.setdefault(host, deque()).append(task)
+        self._queued += 1
+        self._slot(host, time.monotonic())
+
+    def _slot(self, host: str, now: float):
+        """
+        有待派发任务且并发未满的主机排入就绪队列或间隔等待堆
+        """
+        if host in self._slotted or host not in self._hosts or self._active[host] >= self.host_concurrency:
+            return
+        self._slotted.add(host)
+        if self._next_at[host] > now:
+            heapq.heappush(self._cooling, (self._next_at[host], host))
+        else:
+            self._ready[host] = None
+
+    def close(self):
+        """
+        不再放入新任务,剩余任务处理完后 get 抛出 Empty
+        """
+        with self._cond:
+            self._open = False
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._queued + len(self._delayed)
+
+    def drained(self) -> bool:
+        with self._cond:
+            return not (self._queued or self._delayed or self._inflight)
+
+    def _pick(self, now: float):
+        """
+        :return: (可派发的任务, 最近一个主机可派发前需等待的秒数)
+        """
+        while self._delayed and self._delayed[0][0] <= now:
+            self._enqueue(heapq.heappop(self._delayed)[2])
+        while self._cooling and self._cooling[0][0] <= now:
+            self._ready[heapq.heappop(self._cooling)[1]] = None
+        if not self._ready:
+            waits = [heap[0][0] - now for heap in (self._delayed, self._cooling) if heap]
+            return None, min(waits) if waits else None
+        host, _ = self._ready.popitem(last=False)
+        self._slotted.discard(host)
+        pending = self._hosts[host]
+        task = pending.popleft()
+        self._active[host] += 1
+        self._next_at[host] = now + self.host_delay
+        self._queued -= 1
+        self._inflight += 1
+        if pending:
+            # 已派发的主机重新排到队尾,下次优先其他主机
+            self._slot(host, now)
+        else:
+            del self._hosts[host]
+        return task, None
+
+    def get(self, timeout=None):
+        """
+        :return: 下一个可派发的任务;超时前暂无可派发任务时返回 None
+        :raise Empty: 队列、退避中、执行中的任务均已清空,且不再有新任务放入
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                task, wait = self._pick(now)
+                if task is not None:
+                    return task
+                if not (self._queued or self._delayed or self._inflight or self._open):
+                    raise Empty
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait = min(wait, deadline - now) if wait is not None else deadline - now
+                self._cond.wait(wait)
+
+    def retry(self, task: dict) -> bool:
+        """
+        瞬时失败的任务延后重新入队,需随后调用 done
+        :return: 超过重试次数时返回 False
+        """
+        attempts = task.get("attempts", 0) + 1
+        if attempts > self.retries:
+            return False
+        task["attempts"] = attempts
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + self.backoff * 2 ** (attempts - 1), next(self._seq), task))
+            self.retried += 1
+            self._cond.notify_all()
+        return True
+
+    def done(self, task: dict):
+        with self._cond:
+            self._active[task["host"]] -= 1
+            self._inflight -= 1
+            self._slot(task["host"], time.monotonic())
+            self._cond.notify_all()
@@ -1,39 +1,47 @@
 import os
-import io
 import time
 import argparse
-from bs4 import BeautifulSoup
 import threading
 import logging
-from queue import Queue
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from seleniumwire import webdriver  
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from selenium.common.exceptions import WebDriverException, TimeoutException
-from urllib.parse import urlsplit, urlunsplit
-from openpyxl import Workbook
-from openpyxl.drawing.image import Image as XLImage
-from PIL import Image as PILImage, ImageOps
 from AISupport import *
-from selenium.webdriver.firefox.service import Service
+from BrowserSupport import BrowserPool, begin_navigation, wait_for_settle, get_status_code, \
+    BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, SETTLE_MAX_WAIT, SETTLE_QUIET
+from Autoscale import Autoscaler
+from ResultWriter import ResultWriter, ROWS_PER_FILE
+from ResultStore import ResultStore, row_to_result, should_skip, DB_PATH
+from JudgeCache import JudgeCache, JUDGE_CACHE_PATH, JUDGE_CACHE_SIZE, JUDGE_CACHE_DISTANCE
+import ImagePipeline
+from ImagePipeline import process_screenshot, ARCHIVE_FORMAT, ARCHIVE_QUALITY, IMAGE_WORKERS
+from LocalJudge import judge as local_judge
+from Dedup import DedupIndex, navigation_url, target_key, content_key
+from Scheduler import HostScheduler, is_transient, HOST_CONCURRENCY, HOST_DELAY, RETRIES, RETRY_BACKOFF
+from ResourcePolicy import ResourcePolicy, BLOCK_DEFAULT, MAX_RESOURCE_KB
+from FastScan import fast_scan, FAST_CONCURRENCY, FAST_TIMEOUT
+from Metrics import Metrics, StageTimer
+from Cluster import Coordinator, ClusterWorker, CLUSTER_BIND, LEASE_SIZE, LEASE_TTL
+from PreCheck import precheck_urls, PRECHECK_CONCURRENCY, PRECHECK_TIMEOUT
 
 # === 配置 ===
-TARGET_IMG_HIGHT = 200
-ROW_HEIGHT = 150
 PROJ_INDEX = datetime.now().strftime("%Y%m%d%H%M%S")
 
 # === 日志设置 ===
 LOG_FILENAME = "batchURL.log"
 
-with open(LOG_FILENAME, 'w', encoding='utf-8') as f:
-    f.write('')
-logging.basicConfig(
-    filename=LOG_FILENAME,
-    filemode="a",
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    level=logging.INFO,
-    encoding='utf-8'
-)
+def setup_logging():
+    # 仅在主进程执行,图片处理子进程(spawn)导入本模块时不清空日志
+    with open(LOG_FILENAME, 'w', encoding='utf-8') as f:
+        f.write('')
+    logging.basicConfig(
+        filename=LOG_FILENAME,
+        filemode="a",
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        level=logging.INFO,
+        encoding='utf-8'
+    )
 
 def print_banner():
     try:
@@ -54,22 +62,49 @@ type_define = {"1":"正常系统",
                 "4":"欢迎页",
                 "5":"白页"}
 
-def page_judge(url: str, html: str, http_status: int, imgPath: str, token: str = None) -> str:
+def judge_cache_lookup(cache: JudgeCache, url: str, imgPath: str, html: str, phash: int = None):
+    """
+    :return: (缓存键, 命中的判定结果或 None)
+    """
+    if cache is None:
+        return None, None
+    try:
+        key = cache.key(imgPath, html, phash)
+    except Exception as e:
+        logging.info(f"判定缓存查询失败: {e}")
+        return None, None
+    res = cache.get(key)
+    if res is not None:
+        logging.info(f"判定缓存命中->{res}:{url}")
+    return key, res
+
+
+def page_judge(url: str, html: str, http_status: int, imgPath: str, token: str = None, nav: dict = None, cache: JudgeCache = None, phash: int = None, pixel_stddev: float = None) -> str:
     res = None
     if token :
-        res =  page_judge_ai(imgPath,token)
+        key, res = judge_cache_lookup(cache, url, imgPath, html, phash)
+        if res is not None:
+            return res
+        try:
+            res =  page_judge_ai(imgPath,token)
+        except AIThrottled:
+            logging.info(f"AI 调用被限流,转本地判断: {url}")
+        if res is not None and key is not None:
+            cache.put(key, res)
     if res is None:
-        return page_judge_local(url=url,html=html,http_status=http_status)
+        return page_judge_local(url=url,html=html,http_status=http_status,nav=nav,pixel_stddev=pixel_stddev)
     else:
         return res
 
 
-def page_judge_ai(imgPath,token):
+def page_judge_ai(imgPath,token,max_tokens=AI_TOKEN_BUDGET - AI_PROMPT_TOKENS):
 
     # imgb64 = base64.b64encode(screenshot).decode("utf-8")
-    imgPath = imgTokenSimplizer(imgPath)
+    imgPath = imgTokenFit(imgPath, max_tokens)
     res = agent_call(token=token,imgPath = imgPath,text= PROMPT_PAGE_JUDGE)
     logging.info(f"AI call->{res}:{imgPath}:prompt->PROMPT_PAGE_JUDGE")
+    if is_throttled(res):
+        raise AIThrottled(res.get("code"))
     res = getAIResponse(res)
     if res in type_define.keys() :
         return type_define[res]
@@ -79,176 +114,448 @@ def page_judge_ai(imgPath,token):
     return None
 
 
-def page_judge_local(url: str, html: str, http_status: int) -> str:
-    #TODO：待优化 状态码-》title-》结构复杂度（标签数量）
+def page_judge_ai_batch(imgPaths: list, token, token_budget=AI_TOKEN_BUDGET) -> list:
+    """
+    多张截图一次请求,按 token 预算为每张图选择压缩程度
+    :return: 与 imgPaths 等长的判定结果,回复缺失的位置为 None
+    """
+    verdicts = [None] * len(imgPaths)
+    present = [i for i, p in enumerate(imgPaths) if p and os.path.exists(p)]
+    if not present:
+        return verdicts
+    per_image = max(AI_MIN_IMAGE_TOKENS, (token_budget - AI_PROMPT_TOKENS) // len(present))
+    fitted = [imgTokenFit(imgPaths[i], per_image) for i in present]
+    res = agent_call_batch(token, fitted, PROMPT_PAGE_JUDGE_BATCH.format(count=len(fitted)))
+    logging.info(f"AI batch call->{res}:{len(fitted)} images:{per_image} tokens/image")
+    if is_throttled(res):
+        raise AIThrottled(res.get("code"))
+    answers = parse_batch_answer(getAIResponse(res), len(fitted))
+    for no, i in enumerate(present, start=1):
+        verdicts[i] = type_define.get(answers.get(no))
+    if len(answers) < len(fitted):
+        logging.error(f"AI 批量响应不完整({len(answers)}/{len(fitted)}):{getAIResponse(res)}")
+    return verdicts
+
+
+def page_judge_local(url: str, html: str, http_status: int, nav: dict = None, pixel_stddev: float = None) -> str:
+    # 状态码 -> 中间件/WAF 特征 -> 截图色彩 -> 登录表单 -> title 关键词
+    if (http_status is None or http_status < 0) and nav:
+        http_status = nav["status"]
     if http_status is None:
         http_status = 0
-    if  http_status >= 500 or http_status >= 400:
-        return type_define["3"]
-
-    #lowered = html.lower()
-    soup = BeautifulSoup(html, 'html.parser')
-    # 简单结构页判断: title 为空或含错误关键词 + 页面标签少
-    title = soup.title.string.strip().lower() if soup.title and soup.title.string else ""
-    body_tags = soup.find_all(True)
-    tag_count = len(body_tags)
-
-    error_keywords = ["404", "not found", "403", "forbidden", "502", "bad gateway", "error"]
-    keyword_hit = [kw for kw in error_keywords if  kw in title]
-
-    if keyword_hit:
-        logging.info(f"URL 命中关键词 {keyword_hit}: {url}")
-        if tag_count < 30:
-            return type_define["3"]
-        return type_define["3"]
-
-    return type_define["1"]
+    kind, reason = local_judge(html, http_status, pixel_stddev)
+    logging.info(f"本地判定 {type_define[kind]}({reason}): {url}")
+    return type_define[kind]
 
 SCREENSHOTS_DIR = ".\\screeshots\\"
-
-def resize_image(image_bytes, target_height=TARGET_IMG_HIGHT,idx = None):
-    img = PILImage.open(io.BytesIO(image_bytes))
-
-    if idx is not None and isinstance(idx,int):
-        os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
-        img.save(os.path.join(SCREENSHOTS_DIR, f"{PROJ_INDEX}_{idx}.png"), format="PNG", optimize=True)
-    h_percent = target_height / float(img.size[1])
-    w_size = int(img.size[0] * h_percent)
-    img = img.resize((w_size, target_height), PILImage.LANCZOS)
-    img = ImageOps.expand(img, border=2, fill='black')
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG", optimize=True)
-    buffer.seek(0)
-    return buffer
-
-# === 创建浏览器实例 ===
-def create_browser():
-    options = FirefoxOptions()
-    options.add_argument("--headless")
-    options.accept_insecure_certs = True
-    service = Service(os.environ.get('geckodriver_exe'))
-    driver = webdriver.Firefox( seleniumwire_options={}, options=options,service=service )
-    driver.set_page_load_timeout(15)
-    return driver
-
-# === 获取状态码 ===
-def normalize_url(url: str):
-    parts = urlsplit(url)
-    # 丢弃 fragment
-    return urlunsplit((parts.scheme, parts.netloc, parts.path, parts.query, ''))
-
-
-def get_status_code(driver):
-    try:
-        norm_current = normalize_url(driver.current_url)
-        for request in reversed(driver.requests):
-            if request.response :
-                norm_request = normalize_url(request.url)
-                if  norm_request  == norm_current:
-                    logging.info(f"获取 HTTP 响应码: {request.response.status_code}:{ request.url}")
-                    return request.response.status_code
-    except Exception as e:
-        logging.exception(f"获取 HTTP 响应码失败: {str(e)}:{ request.url}")
-        pass
-    return -1
+THUMBS_DIR = os.path.join(SCREENSHOTS_DIR, "thumbs")
+
+# === 单个目标访问 ===
+def visit(browser, task, llm_token, settle_max=SETTLE_MAX_WAIT, settle_quiet=SETTLE_QUIET, judge_cache=None, ai_stage=None,
+          image_format=ARCHIVE_FORMAT, image_quality=ARCHIVE_QUALITY, ai_max_tokens=AI_TOKEN_BUDGET - AI_PROMPT_TOKENS,
+          dedup=None):
+    driver, capture = browser.driver, browser.capture
+    idx, url = task["id"], task["url"]
+    precheck = task.get("precheck")
+    target = navigation_url(url)
+    timer = StageTimer()
+    with timer.stage("navigation"):
+        begin_navigation(driver, capture, target)
+        driver.get(target)
+    with timer.stage("settle"):
+        settle = wait_for_settle(driver, capture, max_wait=settle_max, quiet=settle_quiet)
+    with timer.stage("page_source"):
+        html = driver.page_source
+    if dedup is not None:
+        # 落地页或页面内容与已处理目标相同,复用其截图与判定
+        keys = [content_key(html)]
+        current_url = driver.current_url
+        if current_url.startswith("http"):
+            keys.insert(0, target_key(current_url))
+        primary = dedup.claim(keys, idx)
+        if primary is not None:
+            logging.info(f"与 #{primary} 重复,跳过截图与判定: {url} -> {current_url}")
+            return {"duplicate_of": primary, "image": None, "settle": settle, "timings": timer.stages}
+    # 截图先交给图片进程池,与读取状态码并行
+    with timer.stage("screenshot"):
+        screenshot = driver.get_screenshot_as_png()
+    name = f"{PROJ_INDEX}_{idx}"
+    images = ImagePipeline.get_executor().submit(
+        process_screenshot, screenshot,
+        archive_base=os.path.join(os.path.abspath(SCREENSHOTS_DIR), name),
+        thumb_path=os.path.abspath(os.path.join(THUMBS_DIR, f"{name}.png")),
+        ai_path=os.path.join(os.path.abspath(SCREENSHOTS_DIR), f"{name}_retoken.png") if llm_token else None,
+        archive_format=image_format, quality=image_quality, ai_max_tokens=ai_max_tokens)
+    del screenshot
+    with timer.stage("status"):
+        http_status, nav = get_status_code(driver, capture)
+    if http_status == -1 and precheck and precheck["http_status"]:
+        # 浏览器侧未捕获到主文档响应时,沿用预检结果
+        http_status = precheck["http_status"]
+        logging.info(f"沿用预检响应码: {http_status}:{url} -> {precheck['final_url']}")
+    images = images.result()
+    timer.add("image", images["elapsed"])
+    imgPath = images["ai"]
+    logging.info(f"ai call imgPath:{imgPath}")
+    outcome = {"image": images["thumbnail"], "settle": settle, "http_status": http_status, "screenshot": images["archive"],
+               "timings": timer.stages}
+    if nav and nav["blocked"]:
+        outcome["blocked"], outcome["blocked_bytes"] = nav["blocked"], nav["blocked_bytes"]
+        logging.info(f"资源拦截 {nav['blocked']} 个请求,截断 {nav['blocked_bytes'] / 1024:.0f}KB: {url}")
+    if llm_token and ai_stage is not None:
+        # AI 判定交给异步阶段,浏览器直接处理下一个目标
+        key, status = judge_cache_lookup(judge_cache, url, imgPath, html, images["hash"])
+        if status is None:
+            outcome["judge"] = {"html": html, "nav": nav, "imgPath": imgPath, "cache_key": key, "pixel_stddev": images["stddev"]}
+    else:
+        with timer.stage("judge_ai" if llm_token else "judge_local"):
+            status = page_judge(url=url, html = html, http_status = http_status, imgPath = imgPath, token = llm_token, nav = nav, cache = judge_cache, phash = images["hash"], pixel_stddev = images["stddev"])
+    outcome["status"] = status
+    return outcome
 
 # === 浏览器池工作线程 ===
-def worker(thread_id, task_queue, result_dict, lock, llm_token, progress_callback, status_dict):
-    driver = create_browser()
+def worker(thread_id, task_queue, emit, llm_token, status_dict, pool, visit_options, stop_event=None, metrics=None):
+    started = time.time()
+    busy = 0.0
+    # 浏览器在取到任务时创建,启动失败只影响当前任务
+    browser = None
     while True:
+        # 自动扩缩容要求本线程退出
+        if stop_event is not None and stop_event.is_set():
+            break
         try:
             task = task_queue.get(timeout=3)
-        except:
+        except Empty:
             break
+        if task is None:
+            continue
 
-        idx, url = task
+        task_started = time.time()
+        idx, url = task["id"], task["url"]
+        status_dict["current"] = f"线程-{thread_id} 正在处理: {idx} - {url}"
         try:
-            status_dict["current"] = f"线程-{thread_id} 正在处理: {idx} - {url}"
-            driver.get(url)
-            time.sleep(2)
-            html = driver.page_source
-            http_status = get_status_code(driver)
-            screenshot = driver.get_screenshot_as_png()
-            image = resize_image(image_bytes = screenshot,idx = idx)
-            imgPath = os.path.join( os.path.abspath(SCREENSHOTS_DIR), f"{PROJ_INDEX}_{idx}.png")
-            logging.info(f"ai call imgPath:{imgPath}")
-            status = page_judge(url=url, html = html, http_status = http_status, imgPath = imgPath, token = llm_token)
-        except TimeoutException:
-            status = "无法访问(访问超时)"
-            image = None
-        except WebDriverException:
-            status = "无法访问(Web异常)"
-            image = None
-        except Exception as e:
-            status = "无法访问(其他异常)"
-            image = None
-            logging.exception(f"处理 {url} 异常:{e} ")
-
-        with lock:
-            result_dict[idx] = {
-                "id": idx,
-                "url": url,
-                "status": status,
-                "image": image
-            }
-            if progress_callback:
-                progress_callback()
-
-        task_queue.task_done()
-
-    driver.quit()
-
-# === 写入 Excel 文件 ===
-def write_excel(results: list, output_path):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "访问结果"
-    ws.append(["ID", "URL", "访问状态", "截图"])
-
-    for row_num, res in enumerate(results, start=2):
-        ws.cell(row=row_num, column=1, value=res["id"])
-        ws.cell(row=row_num, column=2, value=res["url"])
-        ws.cell(row=row_num, column=3, value=res["status"])
-        if res["image"]:
-            img = XLImage(res["image"])
-            ws.add_image(img, f"D{row_num}")
-            ws.row_dimensions[row_num].height = ROW_HEIGHT
-        else:
-            ws.cell(row=row_num, column=4, value="（无截图）")
-            ws.row_dimensions[row_num].height = 20
-
-    ws.column_dimensions["A"].width = 6
-    ws.column_dimensions["B"].width = 50
-    ws.column_dimensions["C"].width = 20
-    ws.column_dimensions["D"].width = 45
-    wb.save(output_path)
-    print(f"\n✅ Excel 文件已保存: {output_path}")
+            # 浏览器会话失效时换新实例重试一次;重建失败按本任务失败处理,下个任务再尝试创建
+            for attempt in (1, 2):
+                try:
+                    if browser is None:
+                        browser = pool.acquire()
+                    outcome = visit(browser, task, llm_token, **visit_options)
+                except TimeoutException:
+                    outcome = {"status": "无法访问(访问超时)", "image": None, "failed": True, "transient": True}
+                except WebDriverException as e:
+                    outcome = {"status": "无法访问(Web异常)", "image": None, "failed": True, "transient": is_transient(e)}
+                except Exception as e:
+                    outcome = {"status": "无法访问(其他异常)", "image": None, "failed": True}
+                    logging.exception(f"处理 {url} 异常:{e} ")
+                if outcome.get("failed") and attempt == 1 and (browser is None or not pool.is_alive(browser)):
+                    logging.warning(f"线程-{thread_id} 浏览器会话失效,重建后重试: {url}")
+                    pool.release(browser)
+                    browser = None
+                    continue
+                break
+
+            if outcome.get("transient") and task_queue.retry(task):
+                # 超时/连接重置等瞬时失败,退避后换时机重试
+                logging.info(f"{outcome['status']},第 {task['attempts']} 次重试排队: {url}")
+            elif outcome.get("duplicate_of") is not None:
+                record = visit_options["dedup"].follow(outcome["duplicate_of"], {"id": idx, "url": url, "settle": outcome["settle"],
+                                                                                   "timings": outcome["timings"]})
+                if record is not None:
+                    emit(record)
+            else:
+                result = {
+                    "id": idx,
+                    "url": url,
+                    "status": outcome["status"],
+                    "image": outcome["image"],
+                    "settle": outcome.get("settle"),
+                    "http_status": outcome.get("http_status"),
+                    "screenshot": outcome.get("screenshot"),
+                    "blocked": outcome.get("blocked"),
+                    "blocked_bytes": outcome.get("blocked_bytes"),
+                    "timings": outcome.get("timings") or {}
+                }
+                if outcome.get("judge"):
+                    visit_options["ai_stage"].submit({"result": result, "judge": outcome["judge"]})
+                else:
+                    emit(result)
+        finally:
+            # 无论如何都要归还任务,否则其他线程会一直等待这个执行中的任务
+            task_queue.done(task)
+            busy += time.time() - task_started
+
+        if browser is not None:
+            try:
+                browser = pool.checkin(browser)
+            except Exception as e:
+                logging.exception(f"线程-{thread_id} 回收浏览器失败: {e}")
+                browser = None
+
+    pool.release(browser)
+    if metrics is not None:
+        metrics.worker_time(busy, time.time() - started)
 
 # === 自动计算线程数 ===
 def calculate_worker_count(url_count, max_limit=8):
     if url_count <= 10:
-        return min(2, url_count)
+        return min(2, url_count, max_limit)
     elif url_count <= 100:
-        return min(4, url_count)
+        return min(4, url_count, max_limit)
     elif url_count <= 300:
-        return min(6, url_count)
+        return min(6, url_count, max_limit)
     else:
         return min(max_limit, url_count // 20 + 2)
 
 
+def check_token(token: str) -> bool:
+    """
+    token 校验,网络异常或返回格式异常时视为不可用
+    """
+    try:
+        return is_token_valid(token)
+    except Exception as e:
+        logging.warning(f"LLM TOKEN 校验异常: {e}")
+        return False
+
+
+def start_browsers(args, prewarm: int):
+    """
+    token 校验与浏览器预热并行
+    :param prewarm: 预热的浏览器数,0 为不预热
+    :return: (浏览器池, 可用的 llm_token 或 None)
+    """
+    startup = ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup")
+    token_check = startup.submit(check_token, args.llm_token) if args.llm_token is not None else None
+    policy = ResourcePolicy(args.block, args.max_resource_kb)
+    pool = BrowserPool(max_pages=args.browser_max_pages, max_rss_mb=args.browser_max_rss,
+                       policy=policy if policy.enabled else None, profile_cache=not args.no_profile_cache)
+    if prewarm:
+        pool.prewarm(prewarm)
+    llm_token = args.llm_token
+    if token_check is not None:
+        if token_check.result():
+            print("✅LLM TOKEN已配置")
+        else :
+            llm_token = None
+            print("❌LLM TOKEN不可用")
+    startup.shutdown(wait=False)
+    return pool, llm_token
+
+
+def make_emit(put, dedup, lock, on_result):
+    """
+    结果出口: put 写入/回传后在锁内调用 on_result,同时放出等待该结果的重复任务
+    """
+    def emit(result):
+        pending = [result]
+        while pending:
+            res = pending.pop()
+            put(res)
+            with lock:
+                on_result(res)
+            pending.extend(dedup.complete(res))
+    return emit
+
+
+def run_browsers(args, task_queue, emit, llm_token, pool, dedup, metrics, worker_count, scaler):
+    """
+    浏览器阶段: 启动 AI 判定与截图处理,按 worker_count 或自动扩缩容运行工作线程直至任务队列清空
+    :param scaler: [Autoscaler 或 None],自动扩缩容时填入供进度回调记录状态
+    :return: (judge_cache, ai_stage)
+    """
+    threads = []
+    status_dict = {"current": ""}
+    judge_cache = None
+    if llm_token and args.judge_cache:
+        judge_cache = JudgeCache(args.judge_cache, max_size=args.judge_cache_size, max_distance=args.judge_cache_distance)
+
+    def finish_judge(job, verdict):
+        judge, result = job["judge"], job["result"]
+        if verdict is None:
+            started = time.perf_counter()
+            verdict = page_judge_local(url=result["url"], html=judge["html"], http_status=result["http_status"],
+                                       nav=judge["nav"], pixel_stddev=judge["pixel_stddev"])
+            result["timings"]["judge_local"] = round(time.perf_counter() - started, 4)
+        elif judge_cache is not None and judge["cache_key"] is not None:
+            judge_cache.put(judge["cache_key"], verdict)
+        result["status"] = verdict
+        emit(result)
+
+    def classify_jobs(jobs):
+        started = time.perf_counter()
+        try:
+            return _classify_jobs(jobs)
+        finally:
+            # 同批截图共用一次请求,各自计入整批耗时
+            elapsed = round(time.perf_counter() - started, 4)
+            for job in jobs:
+                timings = job["result"]["timings"]
+                timings["judge_ai"] = round(timings.get("judge_ai", 0) + elapsed, 4)
+
+    def _classify_jobs(jobs):
+        paths = [job["judge"]["imgPath"] for job in jobs]
+        max_tokens = args.ai_token_budget - AI_PROMPT_TOKENS
+        if len(jobs) == 1:
+            return [page_judge_ai(paths[0], llm_token, max_tokens=max_tokens)]
+        verdicts = page_judge_ai_batch(paths, llm_token, token_budget=args.ai_token_budget)
+        # 批量回复中缺失的截图单独补判
+        return [verdict if verdict is not None else page_judge_ai(path, llm_token, max_tokens=max_tokens)
+                for verdict, path in zip(verdicts, paths)]
+
+    ai_stage = None
+    if llm_token:
+        ai_stage = AIDispatcher(classify_jobs, finish_judge, concurrency=args.ai_concurrency, rate=args.ai_rate,
+                                retries=args.ai_retries, batch_size=args.ai_batch).start()
+    visit_options = {"settle_max": args.settle_max, "settle_quiet": args.settle_quiet, "judge_cache": judge_cache, "ai_stage": ai_stage, "dedup": dedup,
+                     "image_format": args.image_format, "image_quality": args.image_quality,
+                     "ai_max_tokens": max(AI_MIN_IMAGE_TOKENS, args.ai_token_budget - AI_PROMPT_TOKENS)}
+    os.makedirs(THUMBS_DIR, exist_ok=True)
+    ImagePipeline.get_executor(args.image_workers)
+    if args.autoscale:
+        def spawn(stop_event):
+            t = threading.Thread(target=worker, args=(len(threads) + 1, task_queue, emit, llm_token, status_dict, pool, visit_options, stop_event, metrics))
+            threads.append(t)
+            t.start()
+            return t
+
+        scaler[0] = Autoscaler(spawn, task_queue.qsize, max_workers=args.max_workers, mem_budget_mb=args.mem_budget)
+        scaler[0].start()
+        scaler[0].join()
+        logging.info(f"自动扩缩容: 峰值线程数 {scaler[0].peak_workers}")
+    else:
+        for i in range(worker_count):
+            t = threading.Thread(target=worker, args=(i + 1, task_queue, emit, llm_token, status_dict, pool, visit_options, None, metrics))
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+    pool.close()
+    ImagePipeline.shutdown()
+    if ai_stage is not None:
+        ai_stage.close()
+        logging.info(f"AI 判定阶段: {ai_stage.stats()}")
+    return judge_cache, ai_stage
+
+
+def run_worker(args):
+    """
+    集群工作节点: 不读取输入文件、不写报告,向协调节点租约领取任务,本地浏览器池处理后逐条回传
+    """
+    pool, llm_token = start_browsers(args, prewarm=2 if args.autoscale else args.max_workers)
+    try:
+        serve_worker(args, pool, llm_token)
+    finally:
+        pool.close()
+
+
+def serve_worker(args, pool, llm_token):
+    start_time = time.time()
+    metrics = Metrics(args.metrics, textfile=args.metrics_textfile, port=args.metrics_port).start()
+    dedup = DedupIndex()
+    lock = threading.Lock()
+    scaler = [None]
+    # 租约任务持续放入,协调节点通知完成后关闭
+    task_queue = HostScheduler(host_concurrency=args.host_concurrency, host_delay=args.host_delay,
+                               retries=args.retries, backoff=args.retry_backoff, open_ended=True)
+    client = ClusterWorker(args.coordinator, task_queue, lease_size=args.lease_size, low_water=args.max_workers,
+                           key=args.cluster_key)
+
+    def send(result):
+        client.put(result)
+        metrics.record(result)
+
+    def on_sent(result):
+        if scaler[0]:
+            scaler[0].record(result["status"])
+        print(f"\r已回传: {client.sent}", end="")
+
+    emit = make_emit(send, dedup, lock, on_sent)
+
+    try:
+        client.start()
+    except OSError as e:
+        print(f"❌ 无法连接协调节点 {args.coordinator}: {e}")
+        metrics.close()
+        return
+    print(f"📊 浏览器池线程数: {'自动(上限 %d)' % args.max_workers if args.autoscale else args.max_workers}")
+    judge_cache, ai_stage = run_browsers(args, task_queue, emit, llm_token, pool, dedup, metrics, args.max_workers, scaler)
+    client.close()
+    if judge_cache is not None:
+        judge_cache.save()
+        print(f"\n🧠 AI 判定缓存: {judge_cache.stats()}")
+    if task_queue.retried:
+        print(f"🔁 瞬时失败重试: {task_queue.retried} 次")
+    metrics.close()
+    print(f"\n📈 阶段耗时(秒):\n{metrics.summary(ai_stage.stats() if ai_stage is not None else None)}")
+    duration = time.time() - start_time
+    print(f"\n⏱️ 工作节点退出，回传 {client.sent} 条，耗时：{duration:.2f} 秒")
+
+
 def main():
+    setup_logging()
    
     parser = ArgumentParserBanner(description="批量获取目标URL访问状态")
     parser.add_argument('-i', '--input', default='urls', help='定义目标,一行一个目标(txt)')
     parser.add_argument('-o', '--output', default='url_results', help='定义输出文件名，不加后缀')
+    parser.add_argument('--rows-per-file', type=int, default=ROWS_PER_FILE, help=f'单个 Excel 最多写入的行数,超出自动切分(默认{ROWS_PER_FILE})')
+    parser.add_argument('--db', default=DB_PATH, help=f'结果库路径(SQLite,默认{DB_PATH})')
+    parser.add_argument('--resume', action='store_true', help='续跑该输入文件上次中断的任务,已完成的目标直接复用')
+    parser.add_argument('--rescan-older-than', type=float, metavar='DAYS', help='增量复扫: 仅重新访问失败、未记录或早于 DAYS 天的目标')
+    parser.add_argument('--image-workers', type=int, default=IMAGE_WORKERS, help=f'截图处理进程数(默认{IMAGE_WORKERS})')
+    parser.add_argument('--image-format', choices=['png', 'webp', 'jpeg'], default=ARCHIVE_FORMAT, help=f'截图存档格式(默认{ARCHIVE_FORMAT})')
+    parser.add_argument('--image-quality', type=int, default=ARCHIVE_QUALITY, help=f'webp/jpeg 存档质量(默认{ARCHIVE_QUALITY})')
     parser.add_argument('--llm-token', help='开启AI支持,配置token')
+    parser.add_argument('--ai-concurrency', type=int, default=AI_CONCURRENCY, help=f'AI 判定并发调用数(默认{AI_CONCURRENCY})')
+    parser.add_argument('--ai-rate', type=float, default=AI_RATE, help=f'AI 判定每秒最多调用次数(默认{AI_RATE})')
+    parser.add_argument('--ai-retries', type=int, default=AI_RETRIES, help=f'AI 调用限流/异常时的重试次数(默认{AI_RETRIES})')
+    parser.add_argument('--ai-batch', type=int, default=AI_BATCH_SIZE, help=f'单次 AI 请求合并的截图数(默认{AI_BATCH_SIZE})')
+    parser.add_argument('--ai-token-budget', type=int, default=AI_TOKEN_BUDGET, help=f'单次 AI 请求的 token 预算,按此压缩截图(默认{AI_TOKEN_BUDGET})')
+    parser.add_argument('--judge-cache', default=JUDGE_CACHE_PATH, help=f'AI 判定缓存文件,置空则关闭缓存(默认{JUDGE_CACHE_PATH})')
+    parser.add_argument('--judge-cache-size', type=int, default=JUDGE_CACHE_SIZE, help=f'AI 判定缓存条目上限(默认{JUDGE_CACHE_SIZE})')
+    parser.add_argument('--judge-cache-distance', type=int, default=JUDGE_CACHE_DISTANCE, help=f'截图感知哈希汉明距离阈值(默认{JUDGE_CACHE_DISTANCE})')
     parser.add_argument('--friend-ui', action='store_true', help='是否启用进度条展示(默认关闭)')
+    parser.add_argument('--max-workers', type=int, default=8, help='浏览器线程数上限(默认8)')
+    parser.add_argument('--autoscale', action='store_true', help='按吞吐/CPU/内存/超时率动态调整浏览器线程数')
+    parser.add_argument('--mem-budget', type=int, help='自动扩缩容的内存预算(MB,含浏览器进程,需安装psutil)')
+    parser.add_argument('--browser-max-pages', type=int, default=BROWSER_MAX_PAGES, help=f'单个浏览器处理多少页面后回收(默认{BROWSER_MAX_PAGES})')
+    parser.add_argument('--browser-max-rss', type=int, default=BROWSER_MAX_RSS_MB, help=f'浏览器内存超过多少MB后回收,需安装psutil(默认{BROWSER_MAX_RSS_MB})')
+    parser.add_argument('--host-concurrency', type=int, default=HOST_CONCURRENCY, help=f'同一主机同时访问的浏览器数(默认{HOST_CONCURRENCY})')
+    parser.add_argument('--host-delay', type=float, default=HOST_DELAY, help=f'同一主机两次访问的最小间隔秒数(默认{HOST_DELAY})')
+    parser.add_argument('--retries', type=int, default=RETRIES, help=f'超时/连接重置等瞬时失败的重试次数(默认{RETRIES})')
+    parser.add_argument('--retry-backoff', type=float, default=RETRY_BACKOFF, help=f'首次重试前等待秒数,之后每次翻倍(默认{RETRY_BACKOFF})')
+    parser.add_argument('--block', default=BLOCK_DEFAULT, help=f'拦截的资源类别 media,font,tracker,image,置空则不拦截(默认{BLOCK_DEFAULT})')
+    parser.add_argument('--max-resource-kb', type=int, default=MAX_RESOURCE_KB, help=f'超过该大小(KB)的子资源替换为空响应,0 不限制(默认{MAX_RESOURCE_KB})')
+    parser.add_argument('--no-profile-cache', action='store_true', help='不使用缓存的 Firefox 配置模板,每个浏览器新建配置')
+    parser.add_argument('--settle-max', type=float, default=SETTLE_MAX_WAIT, help=f'页面加载后最长等待秒数(默认{SETTLE_MAX_WAIT})')
+    parser.add_argument('--settle-quiet', type=float, default=SETTLE_QUIET, help=f'DOM 无变化多少秒视为页面稳定(默认{SETTLE_QUIET})')
+    parser.add_argument('--mode', choices=['browser', 'fast', 'coordinator', 'worker'], default='browser',
+                        help='browser: 浏览器截图判定; fast: 不启动浏览器,异步抓取 HTML 本地判定; '
+                             'coordinator: 分发任务给工作节点并汇总报告; worker: 从协调节点领取任务(默认browser)')
+    parser.add_argument('--fast-concurrency', type=int, default=FAST_CONCURRENCY, help=f'快速模式并发请求数(默认{FAST_CONCURRENCY})')
+    parser.add_argument('--fast-timeout', type=float, default=FAST_TIMEOUT, help=f'快速模式单个请求超时秒数(默认{FAST_TIMEOUT})')
+    parser.add_argument('--screenshot-types', default='', help='快速模式下仍交给浏览器截图判定的类型,逗号分隔,如 正常系统,登录页(默认不截图)')
+    parser.add_argument('--bind', default=CLUSTER_BIND, help=f'协调节点监听地址,多机部署时用 0.0.0.0:端口(默认{CLUSTER_BIND})')
+    parser.add_argument('--coordinator', metavar='HOST:PORT', help='工作节点连接的协调节点地址')
+    parser.add_argument('--cluster-key', help='协调节点与工作节点的共享口令(默认不校验)')
+    parser.add_argument('--lease-size', type=int, default=LEASE_SIZE, help=f'每次租约派发的任务数(默认{LEASE_SIZE})')
+    parser.add_argument('--lease-ttl', type=float, default=LEASE_TTL, help=f'租约多少秒无结果回传即收回重新派发(默认{LEASE_TTL})')
+    parser.add_argument('--metrics', help='每个目标的分阶段耗时写入该 JSONL 文件(默认不写)')
+    parser.add_argument('--metrics-textfile', help='定期导出 Prometheus textfile 指标到该路径(默认不导出)')
+    parser.add_argument('--metrics-port', type=int, help='在该端口提供 Prometheus /metrics 端点(默认不启用)')
+    parser.add_argument('--precheck', action='store_true', help='启用异步预检(DNS/TCP/HEAD),不可达目标不再进入浏览器')
+    parser.add_argument('--precheck-concurrency', type=int, default=PRECHECK_CONCURRENCY, help=f'预检并发数(默认{PRECHECK_CONCURRENCY})')
+    parser.add_argument('--precheck-timeout', type=float, default=PRECHECK_TIMEOUT, help=f'预检单步超时秒数(默认{PRECHECK_TIMEOUT})')
     args = parser.parse_args()
 
+    if args.mode == "worker":
+        if not args.coordinator:
+            parser.error("--mode worker 需要指定 --coordinator HOST:PORT")
+        run_worker(args)
+        return
+
     input_file = args.input
-    output_excel = f"{args.output}_{PROJ_INDEX}.xlsx"
-    llm_token = args.llm_token
-    use_progress_bar = args.friend_ui
+    output_base = f"{args.output}_{PROJ_INDEX}"
 
     if not os.path.exists(input_file):
         print(f"❌ 未找到输入文件：{input_file}")
@@ -262,30 +569,50 @@ def main():
         print("❗ 输入 URL 为空")
         return
     
-    if llm_token is not None:
-        if is_token_valid(llm_token):
-            output_excel = f"{args.output}_{PROJ_INDEX}_AI.xlsx"
-            print("✅LLM TOKEN已配置")
-        else :
-            llm_token = None
-            print("❌LLM TOKEN不可用")
-        
+    if args.mode == "coordinator":
+        # 协调节点只分发任务、汇总结果,浏览器与 AI 判定都在工作节点
+        run_batch(args, urls, None, None, output_base)
+        return
 
-    worker_count = calculate_worker_count(url_count)
-    print(f"📊 总计 URL: {url_count}，浏览器池线程数: {worker_count}")
+    prewarm = 0
+    if args.mode == "browser":
+        prewarm = 2 if args.autoscale else calculate_worker_count(url_count, max_limit=args.max_workers)
+    pool, llm_token = start_browsers(args, prewarm)
+    if llm_token:
+        output_base = f"{args.output}_{PROJ_INDEX}_AI"
+    try:
+        run_batch(args, urls, pool, llm_token, output_base)
+    finally:
+        # 异常退出时也要结束已预热的浏览器进程
+        pool.close()
 
-    start_time = time.time()
 
-    task_queue = Queue()
-    for idx, url in enumerate(urls, start=1):
-        task_queue.put((idx, url))
+def run_batch(args, urls, pool, llm_token, output_base):
+    """
+    读取输入后的完整流程: 去重/续跑/预检,浏览器或快速模式处理,汇总写入报告
+    :param pool: 协调节点模式下为 None
+    """
+    input_file = args.input
+    url_count = len(urls)
+    use_progress_bar = args.friend_ui
+    start_time = time.time()
 
-    results_dict = {}
+    tasks = [{"id": idx, "url": url} for idx, url in enumerate(urls, start=1)]
+    store = ResultStore(args.db)
+    resumed = store.last_unfinished_run(input_file) if args.resume else None
+    if args.resume and resumed is None:
+        print("⚠️ 未找到该输入文件中断的任务,将完整执行")
+    run_started = store.begin_run(PROJ_INDEX, input_file, resumed=resumed)
+    resume_since = run_started if resumed is not None else None
+    fresh_since = time.time() - args.rescan_older_than * 86400 if args.rescan_older_than is not None else None
+
+    metrics = Metrics(args.metrics, textfile=args.metrics_textfile, port=args.metrics_port).start()
+    writer = ResultWriter(output_base, rows_per_file=args.rows_per_file, store=store, run_id=PROJ_INDEX, metrics=metrics).start()
+    dedup = DedupIndex()
     lock = threading.Lock()
-    threads = []
-    status_dict = {"current": ""}
 
     progress_count = [0]
+    blocked_bytes = [0]
     progress_bar = None
     if use_progress_bar:
         try:
@@ -295,26 +622,145 @@ def main():
             print("⚠️ 未安装 tqdm,进度条自动切换为轻量模式")
             use_progress_bar = False
 
-    def progress_callback():
+    scaler = [None]
+
+    def progress_callback(result):
+        if scaler[0]:
+            scaler[0].record(result["status"])
         progress_count[0] += 1
+        blocked_bytes[0] += result.get("blocked_bytes") or 0
         if use_progress_bar and progress_bar:
             progress_bar.update(1)
         else:
             print(f"\r进度: {progress_count[0]}/{url_count}", end="")
 
-    for i in range(worker_count):
-        t = threading.Thread(target=worker, args=(i + 1, task_queue, results_dict, lock, llm_token, progress_callback, status_dict))
-        t.start()
-        threads.append(t)
+    emit = make_emit(writer.put, dedup, lock, progress_callback)
+
+    def emit_duplicate(primary_id, task):
+        record = dedup.follow(primary_id, {"id": task["id"], "url": task["url"]})
+        if record is not None:
+            emit(record)
+
+    # 输入去重: 重复行、http/https 同主机同路径
+    unique_tasks = []
+    for task in tasks:
+        primary = dedup.claim([target_key(task["url"])], task["id"])
+        if primary is None:
+            unique_tasks.append(task)
+        else:
+            emit_duplicate(primary, task)
+    tasks = unique_tasks
+
+    if resume_since is not None or fresh_since is not None:
+        reused = 0
+        pending_tasks = []
+        for task in tasks:
+            row = store.get(task["url"])
+            if should_skip(row, resume_since=resume_since, fresh_since=fresh_since):
+                emit(row_to_result(task["id"], row))
+                reused += 1
+            else:
+                pending_tasks.append(task)
+        print(f"♻️ 复用结果库记录: {reused}，待访问: {len(pending_tasks)}")
+        tasks = pending_tasks
+
+    if args.mode == "fast":
+        wanted = {kind.strip() for kind in args.screenshot_types.split(",") if kind.strip()}
+        print(f"⚡ 快速模式(无浏览器),并发数: {args.fast_concurrency}" + (f",截图类型: {','.join(wanted)}" if wanted else ""))
+        by_id = {task["id"]: task for task in tasks}
+        browser_tasks = []
+
+        def on_fast(res):
+            task = by_id.pop(res["id"])
+            if not res["alive"]:
+                emit({"id": task["id"], "url": task["url"], "status": res["status"], "image": None})
+                return
+            primary = dedup.claim([target_key(res["final_url"])], task["id"])
+            if primary is not None:
+                emit_duplicate(primary, task)
+                return
+            status = type_define[res["status"]]
+            if status in wanted:
+                # 快速判定结果只用于筛选,交给浏览器重新截图判定
+                task["precheck"] = {"http_status": res["http_status"], "final_url": res["final_url"]}
+                browser_tasks.append(task)
+                return
+            emit({"id": task["id"], "url": task["url"], "status": status, "image": None,
+                  "http_status": res["http_status"], "note": f"快速模式({res['reason']})"})
+
+        fast_scan(tasks, on_fast, concurrency=args.fast_concurrency, timeout=args.fast_timeout,
+                  judge_executor=ImagePipeline.get_executor(args.image_workers))
+        print(f"\n⚡ 快速模式完成，交给浏览器截图: {len(browser_tasks)}")
+        tasks = browser_tasks
+    elif args.precheck:
+        print(f"🔎 异步预检中，并发数: {args.precheck_concurrency}")
+        prechecks = precheck_urls([(t["id"], navigation_url(t["url"])) for t in tasks],
+                                  concurrency=args.precheck_concurrency, timeout=args.precheck_timeout)
+        live_tasks = []
+        for task in tasks:
+            pre = prechecks[task["id"]]
+            if pre["alive"]:
+                # 跳转到同一落地页的目标只访问一次
+                primary = dedup.claim([target_key(pre["final_url"])], task["id"]) if pre["final_url"] else None
+                if primary is None:
+                    task["precheck"] = pre
+                    live_tasks.append(task)
+                else:
+                    emit_duplicate(primary, task)
+            else:
+                emit({
+                    "id": task["id"],
+                    "url": task["url"],
+                    "status": pre["status"],
+                    "image": None
+                })
+                logging.info(f"预检不可达 {pre['status']}: {task['url']}")
+        print(f"🔎 预检完成，存活: {len(live_tasks)}，不可达: {sum(1 for p in prechecks.values() if not p['alive'])}")
+        tasks = live_tasks
+
+    if dedup.duplicates:
+        print(f"🧹 去重合并: {dedup.duplicates} 个重复目标")
+
+    if args.mode == "coordinator":
+        print(f"📊 总计 URL: {url_count}，待派发给工作节点: {len(tasks)}")
+        os.makedirs(THUMBS_DIR, exist_ok=True)
+        coordinator = Coordinator(tasks, emit, bind=args.bind, lease_size=args.lease_size, lease_ttl=args.lease_ttl,
+                                  key=args.cluster_key, thumbs_dir=THUMBS_DIR, prefix=PROJ_INDEX)
+        coordinator.serve()
+        judge_cache = ai_stage = None
+        retried = 0
+        if coordinator.requeued:
+            print(f"\n🛰️ 租约收回重新派发: {coordinator.requeued} 个任务")
+    else:
+        worker_count = calculate_worker_count(len(tasks), max_limit=args.max_workers)
+        if args.autoscale:
+            print(f"📊 总计 URL: {url_count}，浏览器池线程数: 自动(上限 {args.max_workers})")
+        else:
+            print(f"📊 总计 URL: {url_count}，浏览器池线程数: {worker_count}")
 
-    for t in threads:
-        t.join()
+        # 按主机轮转派发,避免排序后的输入集中访问同一主机
+        task_queue = HostScheduler(tasks, host_concurrency=args.host_concurrency, host_delay=args.host_delay,
+                                   retries=args.retries, backoff=args.retry_backoff)
+        judge_cache, ai_stage = run_browsers(args, task_queue, emit, llm_token, pool, dedup, metrics, worker_count, scaler)
+        retried = task_queue.retried
 
     if progress_bar:
         progress_bar.close()
 
-    results = [results_dict[i] for i in sorted(results_dict.keys())]
-    write_excel(results, output_excel)
+    writer.close()
+    if judge_cache is not None:
+        judge_cache.save()
+        print(f"\n🧠 AI 判定缓存: {judge_cache.stats()}")
+    if ai_stage is not None:
+        print(f"🧠 AI 判定: {ai_stage.stats()}")
+    if blocked_bytes[0]:
+        print(f"🚫 资源拦截截断: {blocked_bytes[0] / 1024 / 1024:.1f}MB")
+    if retried:
+        print(f"🔁 瞬时失败重试: {retried} 次")
+    store.finish_run(PROJ_INDEX)
+    store.close()
+    metrics.close()
+    print(f"\n📈 阶段耗时(秒):\n{metrics.summary(ai_stage.stats() if ai_stage is not None else None)}")
 
     end_time = time.time()
     duration = end_time - start_time
@@ -0,0 +1,501 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import threading
+import subprocess
+import email
+import email.policy
+from collections import defaultdict, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from PIL import Image
+from Metrics import percentile, STAGES
+from Autoscale import tree_rss_mb, psutil
+
+# === 配置 ===
+BENCH_COUNT = 200
+BENCH_HOSTS = 8
+BENCH_MIX = "static=40,slow=10,redirect=10,login=10,error4xx=8,error5xx=7,welcome=5,blank=5,heavy=10,blackhole=5,bare=3"
+BENCH_SLOW_DELAY = 3.0
+BENCH_AI_LATENCY = 1.0
+BENCH_WORKDIR = "bench_run"
+BENCH_REPORT = "bench_results.jsonl"
+BENCH_SEED = 1
+REDIRECT_HOPS = 3
+HEAVY_ASSETS = 60
+HEAVY_VIDEO_KB = 4096
+RSS_POLL = 0.5
+
+# 场景 -> 期望判定结果
+EXPECTED = {
+    "static": "正常系统", "slow": "正常系统", "redirect": "正常系统", "heavy": "正常系统",
+    "login": "登录页",
+    "error4xx": "错误页", "error5xx": "错误页",
+    "welcome": "欢迎页",
+    "blank": "白页",
+    "blackhole": "无法访问",
+    "bare": "错误页",
+}
+# 场景 -> 期望的主文档响应码,校验浏览器侧是否正确捕获
+EXPECTED_HTTP = {"error4xx": 404, "error5xx": 500, "bare": 404}
+# 页面顶部色条,模拟的 AI 端点按色条颜色回答类型序号
+STRIPE = {"1": (0, 160, 0), "2": (0, 0, 200), "3": (200, 0, 0), "4": (230, 140, 0)}
+
+BATCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batchURL.py")
+
+
+def _word(i: int) -> str:
+    """
+    序号转字母串,页面内容互不相同(去重会忽略数字)
+    """
+    word = ""
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        word = chr(ord("a") + rem) + word
+    return word
+
+
+def _page(kind: str, token: str, title: str, body: str) -> bytes:
+    r, g, b = STRIPE[kind]
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title></head>
+<body style="margin:0;font-family:sans-serif">
+<div style="height:60px;background:rgb({r},{g},{b})"></div>
+<div style="padding:20px">{body}<p>ref {token}</p></div></body></html>""".encode("utf-8")
+
+
+def lan_address():
+    """
+    本机非回环地址: 明文 http 访问该地址时 Firefox 不发送 Sec-Fetch-*,主文档只能按地址匹配
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect(("10.255.255.255", 1))
+        address = sock.getsockname()[0]
+    except OSError:
+        address = None
+    finally:
+        sock.close()
+    return None if not address or address.startswith("127.") else address
+
+
+def render(scenario: str, token: str):
+    """
+    :return: (状态码, Content-Type, 响应体)
+    """
+    html = "text/html; charset=utf-8"
+    if scenario in ("static", "slow", "redirect"):
+        nav = "".join(f'<li><a href="#{n}">栏目 {n} {token}</a></li>' for n in "abcdef")
+        return 200, html, _page("1", token, f"门户 {token}", f"<h1>综合门户 {token}</h1><ul>{nav}</ul><p>新闻动态 通知公告</p>")
+    if scenario == "heavy":
+        imgs = "".join(f'<img src="/asset/{token}/{n}.png" width="32" height="32">' for n in range(HEAVY_ASSETS))
+        style = ("<style>@font-face{font-family:bench;src:url(/asset/%s/font.woff2)}body{font-family:bench}</style>" % token)
+        body = f'{style}<h1>资源门户 {token}</h1>{imgs}<video src="/asset/{token}/big.mp4" autoplay muted></video>'
+        return 200, html, _page("1", token, f"资源门户 {token}", body)
+    if scenario == "login":
+        form = ('<form action="/login" method="post"><input name="username" placeholder="用户名">'
+                '<input type="password" name="password" placeholder="密码"><button>登录</button></form>')
+        return 200, html, _page("2", token, f"统一身份认证 登录 {token}", form)
+    if scenario == "error4xx":
+        return 404, html, _page("3", token, "404 Not Found", f"<h1>404 Not Found</h1><p>{token}</p>")
+    if scenario == "error5xx":
+        return 500, html, _page("3", token, "500 Internal Server Error", f"<h1>500 Internal Server Error</h1><p>{token}</p>")
+    if scenario == "welcome":
+        body = (f"<h1>Welcome to nginx!</h1><p>If you see this page, the nginx web server is successfully installed"
+                f" and working. {token}</p>")
+        return 200, html, _page("4", token, "Welcome to nginx!", body)
+    if scenario == "blank":
+        return 200, html, f"<html><head></head><body><!-- {token} --></body></html>".encode("utf-8")
+    return 404, html, b""
+
+
+# === 目标站点群 ===
+class FarmHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    slow_delay = BENCH_SLOW_DELAY
+    # 非空时为无路径目标的独立主机,根路径返回该标记的 404 页
+    bare_token = None
+    png = b""
+    video = b""
+
+    def _send(self, status: int, content_type: str, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts[0] == "asset":
+            name = parts[-1]
+            if name.endswith(".mp4"):
+                return self._send(200, "video/mp4", self.video)
+            if name.endswith(".woff2"):
+                return self._send(200, "font/woff2", b"\0" * 2048)
+            return self._send(200, "image/png", self.png, {"Cache-Control": "max-age=3600"})
+        if self.bare_token and parts == [""]:
+            return self._send(*render("error4xx", self.bare_token))
+        if len(parts) < 2:
+            return self._send(404, "text/plain", b"not found")
+        scenario, token = parts[0], parts[1]
+        if scenario == "redirect" and len(parts) == 3 and int(parts[2]) > 0:
+            hops = int(parts[2]) - 1
+            location = f"/redirect/{token}/{hops}" if hops else f"/redirect/{token}"
+            return self._send(302, "text/html", b"", {"Location": location})
+        if scenario == "slow":
+            time.sleep(self.slow_delay)
+        status, content_type, body = render(scenario, token)
+        self._send(status, content_type, body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TargetFarm:
+    """
+    本地靶场: 多个回环地址各起一个 HTTP 服务模拟不同主机,另有只监听不应答的黑洞端口
+    """
+
+    def __init__(self, hosts=BENCH_HOSTS, slow_delay=BENCH_SLOW_DELAY):
+        buf = io.BytesIO()
+        Image.new("RGB", (32, 32), (120, 120, 120)).save(buf, format="PNG")
+        handler = type("Handler", (FarmHandler,), {"slow_delay": slow_delay, "png": buf.getvalue(),
+                                                    "video": os.urandom(HEAVY_VIDEO_KB * 1024)})
+        self.handler = handler
+        self.servers = []
+        self.bare_servers = []
+        for n in range(hosts):
+            address = f"127.0.0.{n + 2}"
+            try:
+                server = ThreadingHTTPServer((address, 0), handler)
+            except OSError:
+                # 不支持 127.0.0.0/8 多地址的系统退回单主机
+                if self.servers:
+                    break
+                server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            server.daemon_threads = True
+            self.servers.append(server)
+        # 黑洞: 完成握手后不读取不应答
+        self.blackhole = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.blackhole.bind(("127.0.0.1", 0))
+        self.blackhole.listen(1024)
+
+    @property
+    def hosts(self) -> list:
+        return [f"{s.server_address[0]}:{s.server_address[1]}" for s in self.servers]
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def targets(self, count: int, mix: dict, seed=BENCH_SEED) -> list:
+        """
+        :return: [(url, 场景), ...],按主机排序以模拟真实资产清单
+        """
+        rnd = random.Random(seed)
+        scenarios = rnd.choices(list(mix), weights=list(mix.values()), k=count)
+        hosts = self.hosts
+        targets = []
+        for i, scenario in enumerate(scenarios):
+            token = _word(i)
+            if scenario == "blackhole":
+                targets.append((f"http://127.0.0.1:{self.blackhole.getsockname()[1]}/{token}", scenario))
+                continue
+            if scenario == "bare":
+                targets.append((self._bare_target(token), scenario))
+                continue
+            path = f"/redirect/{token}/{REDIRECT_HOPS}" if scenario == "redirect" else f"/{scenario}/{token}"
+            targets.append((f"http://{hosts[i % len(hosts)]}{path}", scenario))
+        return sorted(targets)
+
+    def _bare_target(self, token: str) -> str:
+        """
+        无路径的明文 http 目标(如 http://10.0.0.5:8080),每个目标独占一个端口
+        """
+        address = lan_address()
+        if address is None:
+            if not self.bare_servers:
+                print("⚠️ 未找到非回环地址,bare 场景退回 127.0.0.1(Firefox 会发送 Sec-Fetch-*,覆盖不完整)")
+            address = "127.0.0.1"
+        handler = type("BareHandler", (self.handler,), {"bare_token": token})
+        server = ThreadingHTTPServer((address, 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.bare_servers.append(server)
+        return f"http://{address}:{server.server_address[1]}"
+
+    def close(self):
+        for server in self.servers + self.bare_servers:
+            server.shutdown()
+        self.blackhole.close()
+
+
+# === 模拟 dashscope ===
+def _answer(png: bytes) -> str:
+    with Image.open(io.BytesIO(png)) as img:
+        img = img.convert("RGB")
+        pixel = img.getpixel((img.width // 2, 2))
+    if min(pixel) > 240:
+        return "5"
+    return min(STRIPE, key=lambda kind: sum((a - b) ** 2 for a, b in zip(STRIPE[kind], pixel)))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    实现 SDK 用到的三个接口: 获取上传凭证、上传文件、多模态对话
+    """
+    latency = BENCH_AI_LATENCY
+    files = None
+    stats = None
+    lock = None
+
+    def _json(self, data: dict, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path.endswith("/uploads"):
+            host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            return self._json({"request_id": "bench", "data": {
+                "policy": "bench", "signature": "bench", "upload_dir": "bench", "upload_host": f"{host}/oss",
+                "expire_in_seconds": 300, "max_file_size_mb": 100, "capacity_limit_mb": 1000,
+                "oss_access_key_id": "bench", "x_oss_object_acl": "private", "x_oss_forbid_overwrite": "true"}})
+        self._json({"code": "NotFound"}, 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = urlsplit(self.path).path
+        if path == "/oss":
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body, policy=email.policy.HTTP)
+            fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                      for part in message.iter_parts()}
+            with self.lock:
+                self.files[f"oss://{fields['key'].decode('utf-8')}"] = fields["file"]
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        request = json.loads(body or b"{}")
+        content = request.get("input", {}).get("messages", [{}])[-1].get("content", [])
+        images = [item["image"] for item in content if "image" in item]
+        time.sleep(self.latency)
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["images"] += len(images)
+            pngs = [self.files.pop(image, None) for image in images]
+        answers = [_answer(png) if png else "1" for png in pngs]
+        if not images:
+            text = "1"
+        elif len(images) == 1:
+            text = answers[0]
+        else:
+            text = "\n".join(f"{n}:{kind}" for n, kind in enumerate(answers, 1))
+        self._json({"request_id": "bench", "output": {"choices": [{"finish_reason": "stop", "message": {
+            "role": "assistant", "content": [{"text": text}]}}]},
+            "usage": {"input_tokens": 100, "output_tokens": 1, "image_tokens": 100 * len(images)}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockDashScope:
+    def __init__(self, latency=BENCH_AI_LATENCY):
+        self.stats = Counter()
+        handler = type("Handler", (MockHandler,), {"latency": latency, "files": {}, "stats": self.stats,
+                                                    "lock": threading.Lock()})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+
+
+# === 运行与统计 ===
+def run_pipeline(cmd: list, env: dict, cwd: str):
+    """
+    :return: (返回码, 耗时秒, 进程树内存峰值MB)
+    """
+    start = time.time()
+    proc = subprocess.Popen(cmd, env=env, cwd=cwd)
+    peak = 0.0
+    if psutil is not None:
+        while proc.poll() is None:
+            peak = max(peak, tree_rss_mb(proc.pid) or 0)
+            time.sleep(RSS_POLL)
+    code = proc.wait()
+    if psutil is None:
+        try:
+            import resource
+            # 未安装 psutil 时只能取到单个子进程的峰值
+            peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        except ImportError:
+            pass
+    return code, time.time() - start, peak
+
+
+def evaluate(metrics_path: str, truth: dict) -> dict:
+    rows = []
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        for line in f:
+            rows.append(json.loads(line))
+    stages = defaultdict(list)
+    confusion = defaultdict(Counter)
+    http_mismatch = defaultdict(Counter)
+    correct = 0
+    for row in rows:
+        for stage, seconds in row["stages"].items():
+            stages[stage].append(seconds)
+        scenario = truth.get(row["url"])
+        if scenario is None:
+            continue
+        status = row["status"] or ""
+        expected = EXPECTED[scenario]
+        hit = status.startswith(expected)
+        if scenario in EXPECTED_HTTP and row.get("http_status") != EXPECTED_HTTP[scenario]:
+            # 判定正确但未捕获到主文档响应码也算错
+            hit = False
+            http_mismatch[scenario][row.get("http_status")] += 1
+        correct += hit
+        confusion[scenario][status] += 1
+    latency = {}
+    for stage in [s for s in STAGES if s in stages] + sorted(set(stages) - set(STAGES)):
+        values = sorted(stages[stage])
+        latency[stage] = {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                          "p99": percentile(values, 0.99)}
+    return {"rows": len(rows), "correct": correct, "latency": latency,
+            "confusion": {k: dict(v) for k, v in confusion.items()},
+            "http_mismatch": {k: dict(v) for k, v in http_mismatch.items()}}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(BATCH_SCRIPT),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in EXPECTED:
+            raise SystemExit(f"未知场景: {name},可选: {','.join(EXPECTED)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batchURL 本地基准测试: 启动靶场与模拟 AI 端点,端到端运行并统计",
+                                     epilog="-- 之后的参数原样传给 batchURL.py,如 -- --max-workers 4 --precheck")
+    parser.add_argument('--count', type=int, default=BENCH_COUNT, help=f'目标数量(默认{BENCH_COUNT})')
+    parser.add_argument('--mix', default=BENCH_MIX, help=f'场景权重(默认{BENCH_MIX})')
+    parser.add_argument('--hosts', type=int, default=BENCH_HOSTS, help=f'模拟主机数(默认{BENCH_HOSTS})')
+    parser.add_argument('--slow-delay', type=float, default=BENCH_SLOW_DELAY, help=f'慢响应场景的延迟秒数(默认{BENCH_SLOW_DELAY})')
+    parser.add_argument('--ai', action='store_true', help='启用模拟 dashscope 端点并开启 AI 判定')
+    parser.add_argument('--ai-latency', type=float, default=BENCH_AI_LATENCY, help=f'模拟 AI 单次调用延迟秒数(默认{BENCH_AI_LATENCY})')
+    parser.add_argument('--seed', type=int, default=BENCH_SEED, help=f'场景抽样随机种子(默认{BENCH_SEED})')
+    parser.add_argument('--workdir', default=BENCH_WORKDIR, help=f'运行目录,每次运行前清空(默认{BENCH_WORKDIR})')
+    parser.add_argument('--report', default=BENCH_REPORT, help=f'结果追加写入该 JSONL,便于跨版本对比(默认{BENCH_REPORT})')
+    argv = sys.argv[1:]
+    passthrough = []
+    if "--" in argv:
+        cut = argv.index("--")
+        argv, passthrough = argv[:cut], argv[cut + 1:]
+    args = parser.parse_args(argv)
+
+    farm = TargetFarm(hosts=args.hosts, slow_delay=args.slow_delay).start()
+    targets = farm.targets(args.count, parse_mix(args.mix), seed=args.seed)
+    truth = {url: scenario for url, scenario in targets}
+    mock = MockDashScope(latency=args.ai_latency).start() if args.ai else None
+
+    workdir = os.path.abspath(args.workdir)
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    with open(os.path.join(workdir, "urls"), "w", encoding="utf-8") as f:
+        f.write("\n".join(url for url, _ in targets))
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    cmd = [sys.executable, BATCH_SCRIPT, "-i", "urls", "-o", "bench", "--db", "bench.db", "--judge-cache", "",
+           "--metrics", metrics_path] + passthrough
+    env = dict(os.environ)
+    if mock is not None:
+        env["DASHSCOPE_HTTP_BASE_URL"] = mock.base_url
+        cmd += ["--llm-token", "bench"]
+
+    print(f"🏁 靶场主机: {len(farm.hosts)},目标: {len(targets)},场景: {dict(Counter(truth.values()))}")
+    try:
+        code, duration, peak = run_pipeline(cmd, env, workdir)
+    finally:
+        farm.close()
+        if mock is not None:
+            mock.close()
+    if code != 0 or not os.path.exists(metrics_path):
+        raise SystemExit(f"❌ batchURL.py 运行失败,返回码 {code}")
+
+    result = evaluate(metrics_path, truth)
+    report = {
+        "ts": round(time.time(), 3),
+        "revision": git_revision(),
+        "count": len(targets),
+        "hosts": len(farm.hosts),
+        "mix": args.mix,
+        "ai": bool(mock),
+        "args": passthrough,
+        "duration": round(duration, 2),
+        "urls_per_second": round(len(targets) / duration, 3) if duration else 0,
+        "peak_rss_mb": round(peak, 1),
+        "accuracy": round(result["correct"] / len(targets), 4) if targets else 0,
+        "latency": result["latency"],
+        "confusion": result["confusion"],
+        "ai_calls": mock.stats["calls"] if mock else 0,
+        "ai_images": mock.stats["images"] if mock else 0,
+    }
+    with open(args.report, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    print(f"\n📊 基准结果 ({report['revision'] or '未知版本'})")
+    print(f"耗时 {report['duration']}s, 吞吐 {report['urls_per_second']} URL/s, 内存峰值 {report['peak_rss_mb']}MB")
+    print(f"准确率 {report['accuracy']:.1%} ({result['correct']}/{len(targets)}),结果行 {result['rows']}")
+    if mock:
+        print(f"AI 调用 {report['ai_calls']} 次,图片 {report['ai_images']} 张")
+    print(f"{'stage':<14}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for stage, item in result["latency"].items():
+        print(f"{stage:<14}{item['count']:>8}{item['p50']:>9.3f}{item['p95']:>9.3f}{item['p99']:>9.3f}")
+    for scenario, statuses in result["confusion"].items():
+        wrong = {status: n for status, n in statuses.items() if not status.startswith(EXPECTED[scenario])}
+        if wrong:
+            print(f"⚠️ {scenario} 期望 {EXPECTED[scenario]},误判: {wrong}")
+    for scenario, codes in result["http_mismatch"].items():
+        print(f"⚠️ {scenario} 期望响应码 {EXPECTED_HTTP[scenario]},实际: {codes}")
+    print(f"📝 已追加到 {args.report}")
+
+
+if __name__ == "__main__":
+    main()